@@ -0,0 +1,123 @@
+import asyncio
+import logging
+import os
+import random
+from collections import defaultdict, deque
+
+import discord
+
+
+log = logging.getLogger("cn_bot.announcements")
+
+ANNOUNCE_WORKERS = int(os.getenv("ANNOUNCE_WORKERS", "4"))
+# Attempts per message before giving up on a channel
+ANNOUNCE_ATTEMPTS = int(os.getenv("ANNOUNCE_ATTEMPTS", "4"))
+BACKOFF_BASE = 1.0
+BACKOFF_MAX = 30.0
+
+
+def _retry_delay(error, attempt):
+    # Honour Discord's retry_after when it reached us, otherwise back off exponentially
+    # with jitter so retries of a broadcast don't line up again
+    retry_after = getattr(error, "retry_after", None)
+    if retry_after:
+        return retry_after
+    return min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt) * random.uniform(0.5, 1.5)
+
+
+def _retryable(error):
+    if isinstance(error, discord.RateLimited):
+        return True
+    if isinstance(error, discord.HTTPException):
+        return error.status == 429 or error.status >= 500
+    return isinstance(error, (asyncio.TimeoutError, OSError))
+
+
+class _Message:
+    __slots__ = ("channel", "kwargs", "future", "attempt")
+
+    def __init__(self, channel, kwargs, future):
+        self.channel = channel
+        self.kwargs = kwargs
+        self.future = future
+        self.attempt = 0
+
+
+# Outgoing announcements, sent by a small pool of workers. Discord rate-limits message
+# sends per channel, so messages are queued per channel and a channel is handed to at
+# most one worker at a time: a broadcast to many channels is spread over the pool, while
+# several messages for one channel go out one after another instead of racing each other
+# into 429s. A channel that needs a retry is parked until its backoff expires without
+# holding up a worker.
+class AnnouncementQueue:
+    def __init__(self, workers=ANNOUNCE_WORKERS):
+        self._worker_count = workers
+        self._workers = []
+        self._pending = defaultdict(deque)
+        self._ready = None
+        self._background = set()
+
+    def _start(self):
+        if self._workers:
+            return
+        self._ready = asyncio.Queue()
+        self._workers = [asyncio.create_task(self._work()) for _ in range(self._worker_count)]
+
+    def submit(self, channel, **kwargs):
+        # Queues channel.send(**kwargs); the returned future resolves to the sent message
+        # or to the error that made it give up
+        self._start()
+        message = _Message(channel, kwargs, asyncio.get_running_loop().create_future())
+        queue = self._pending[channel.id]
+        queue.append(message)
+        if len(queue) == 1:
+            self._ready.put_nowait(channel.id)
+        return message.future
+
+    def broadcast(self, channels, on_done=None, **kwargs):
+        # Queues the same message for every channel. on_done(results) is awaited once all
+        # of them are settled, results being (channel, error or None) pairs.
+        futures = [self.submit(channel, **kwargs) for channel in channels]
+        if on_done is not None:
+            report = asyncio.create_task(self._report(channels, futures, on_done))
+            self._background.add(report)
+            report.add_done_callback(self._background.discard)
+        return futures
+
+    async def _report(self, channels, futures, on_done):
+        results = await asyncio.gather(*futures, return_exceptions=True)
+        try:
+            await on_done([
+                (channel, result if isinstance(result, BaseException) else None)
+                for channel, result in zip(channels, results)
+            ])
+        except Exception:
+            log.exception("Announcement report failed")
+
+    async def _work(self):
+        while True:
+            channel_id = await self._ready.get()
+            queue = self._pending[channel_id]
+            message = queue[0]
+            try:
+                sent = await message.channel.send(**message.kwargs)
+            except Exception as error:
+                message.attempt += 1
+                if _retryable(error) and message.attempt < ANNOUNCE_ATTEMPTS:
+                    delay = _retry_delay(error, message.attempt)
+                    log.warning("Announcement to channel %s failed (%s); retrying in %.1fs", channel_id, error, delay)
+                    asyncio.get_running_loop().call_later(delay, self._ready.put_nowait, channel_id)
+                    continue
+                log.warning("Giving up on announcement to channel %s: %s", channel_id, error)
+                if not message.future.done():
+                    message.future.set_exception(error)
+            else:
+                if not message.future.done():
+                    message.future.set_result(sent)
+
+            queue.popleft()
+            if queue:
+                # Back of the line, so one busy channel can't starve the others
+                self._ready.put_nowait(channel_id)
+            else:
+                del self._pending[channel_id]
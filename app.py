@@ -1,39 +1,150 @@
+import asyncio
 import discord
+from discord import app_commands
 from discord.ext import commands
-import firebase_admin
-from firebase_admin import credentials, firestore
 import os
 from dotenv import load_dotenv
 from keep_alive import keep_alive
 from datetime import datetime
+from functools import partial
+from typing import Literal
+import task_store
+import exports
+import guild_config
+from guild_config import HEAD_ROLES, RECEIVER_ROLES, REMINDER_CHANNEL, STAFF_ROLES
+from instrumentation import command_stats, instrumented
+from views import ReceiverListView, TaskListView
+from reminders import ReminderScheduler
+from announcements import AnnouncementQueue
+from command_sync import sync_commands
+from task_index import TaskIndex
+from message_triggers import MessageTriggers
 
 
 # Load environment variables
 load_dotenv()
 DISCORD_TOKEN = os.getenv("DISCORD_TOKEN")
-FIREBASE_CREDENTIALS_PATH = os.getenv("FIREBASE_CREDENTIALS_PATH")
-
-cred = credentials.Certificate(FIREBASE_CREDENTIALS_PATH)
-firebase_admin.initialize_app(cred)
-db = firestore.client()
+# Default channel for due-date reminders; guilds can pick their own with
+# /configure-reminders. Guilds with neither get no reminders.
+REMINDER_CHANNEL_ID = os.getenv("REMINDER_CHANNEL_ID")
+# Opt-in sharding: SHARD_COUNT ("auto" lets Discord pick) switches to AutoShardedBot, and
+# SHARD_IDS (comma separated) limits this process to some of the shards so several
+# processes can split a deployment against the same storage backend. Splitting needs
+# the total fixed, so SHARD_IDS requires a numeric SHARD_COUNT.
+SHARD_COUNT = os.getenv("SHARD_COUNT")
+SHARD_IDS = os.getenv("SHARD_IDS")
+if SHARD_IDS and not (SHARD_COUNT or "").isdigit():
+    raise ValueError(f"SHARD_IDS needs a numeric SHARD_COUNT, got SHARD_COUNT={SHARD_COUNT!r}")
+# The /lund and /machuda message triggers are the only thing that reads messages; with
+# MESSAGE_TRIGGERS=off the bot no longer receives message events (nor their content)
+# from the gateway at all
+MESSAGE_TRIGGERS = os.getenv("MESSAGE_TRIGGERS", "on").lower() not in ("off", "false", "0", "no")
+
+# Tasks and role settings belong to a server, so commands can't be used in DMs
+class GuildCommandTree(app_commands.CommandTree):
+    async def interaction_check(self, interaction: discord.Interaction):
+        if interaction.guild_id is None:
+            # Autocomplete requests can't be answered with a message
+            if interaction.type == discord.InteractionType.application_command:
+                await interaction.response.send_message("This bot's commands can only be used in a server.", ephemeral=True)
+            return False
+        return True
 
 intents = discord.Intents.default()
-intents.message_content = True
-bot = commands.Bot(command_prefix='/', intents=intents)
+intents.messages = MESSAGE_TRIGGERS
+intents.message_content = MESSAGE_TRIGGERS
+if SHARD_COUNT:
+    bot = commands.AutoShardedBot(
+        command_prefix='/',
+        intents=intents,
+        tree_cls=GuildCommandTree,
+        shard_count=None if SHARD_COUNT == "auto" else int(SHARD_COUNT),
+        shard_ids=[int(shard_id) for shard_id in SHARD_IDS.split(",")] if SHARD_IDS else None
+    )
+else:
+    bot = commands.Bot(command_prefix='/', intents=intents, tree_cls=GuildCommandTree)
+
+async def has_access(interaction, level):
+    config = await task_store.fetch_guild_config(interaction.guild_id)
+    return guild_config.member_has(interaction.user, config, level)
+
+async def send_reminder(task, offset):
+    config = await task_store.fetch_guild_config(task.guild_id)
+    channel_id = config.get(REMINDER_CHANNEL) or REMINDER_CHANNEL_ID
+    channel = bot.get_channel(int(channel_id)) if channel_id else None
+    # The default channel only serves its own guild
+    if channel is None or str(channel.guild.id) != task.guild_id:
+        return
+    role = channel.guild.get_role(int(task.assigned_role))
+    if role is None:
+        return
+    await channel.send(
+        f"{role.mention} Reminder: task '{task.task_name}' (ID: {task.id}) is due <t:{task.due_date}:R>.",
+        allowed_mentions=discord.AllowedMentions(roles=[role])
+    )
+
+reminder_scheduler = ReminderScheduler(send_reminder)
+announcement_queue = AnnouncementQueue()
+# Channels a single /announce can broadcast to
+MAX_ANNOUNCE_CHANNELS = 10
+
+# Discord's cap on fields per embed
+EMBED_FIELD_LIMIT = 25
+
+# Bulk commands take task IDs separated by commas and/or spaces
+MAX_BULK_TASKS = 25
+
+def split_ids(raw):
+    # Comma and/or space separated IDs (task IDs, channel mentions), in order, without
+    # duplicates
+    return list(dict.fromkeys(raw.replace(',', ' ').split()))
+
+# task_id autocomplete, answered from memory on every keystroke
+task_index = TaskIndex()
+task_store.cache.add_listener(task_index.update)
+
+async def visible_to(interaction):
+    # Staff and members allowed to receive any task may pick any task; everyone else
+    # only the tasks assigned to one of their roles
+    if await has_access(interaction, STAFF_ROLES) or await has_access(interaction, RECEIVER_ROLES):
+        return None
+    role_ids = {str(role.id) for role in interaction.user.roles}
+    return lambda task: task.assigned_role in role_ids
+
+def task_choice_name(task):
+    # Choice names are capped at 100 characters
+    suffix = f" · due {datetime.fromtimestamp(task.due_date):%Y-%m-%d} · {task.id}"
+    return task.task_name[:100 - len(suffix)] + suffix
+
+async def task_id_autocomplete(interaction: discord.Interaction, current: str):
+    tasks = task_index.search(str(interaction.guild_id), current, await visible_to(interaction))
+    return [app_commands.Choice(name=task_choice_name(task), value=task.id) for task in tasks]
+
+async def task_ids_autocomplete(interaction: discord.Interaction, current: str):
+    # Completes the last ID in the list, keeping the ones already entered
+    entered = split_ids(current)
+    partial_id = "" if not current or current[-1] in ", " else entered.pop()
+    prefix = " ".join(entered)
+    choices = []
+    for task in task_index.search(str(interaction.guild_id), partial_id, await visible_to(interaction), exclude=set(entered)):
+        value = f"{prefix} {task.id}".strip()
+        # Choice values are capped at 100 characters too
+        if len(value) <= 100:
+            choices.append(app_commands.Choice(name=task_choice_name(task), value=value))
+    return choices
 
 @bot.tree.command(name='create-task', description='Create a new task')
+@instrumented
 async def create_task(interaction: discord.Interaction, task_name: str, description: str, due_date: str, link: str = None):
-    required_roles = ['Seniors', 'mods']  # Specify the role names allowed to create tasks
-    if any(role.name in required_roles for role in interaction.user.roles):
+    if await has_access(interaction, STAFF_ROLES):
         try:
             due_date_obj = datetime.strptime(due_date, "%Y-%m-%d")
 
-            due_date_timestamp = str(int(due_date_obj.timestamp()))
+            due_date_timestamp = int(due_date_obj.timestamp())
         except ValueError:
             await interaction.response.send_message("Invalid date format. Please use YYYY-MM-DD", ephemeral=True)
             return
 
-        task_ref = db.collection('tasks').document()
         task = {
             "task_name": task_name,
             "description": description,
@@ -42,89 +153,79 @@ async def create_task(interaction: discord.Interaction, task_name: str, descript
             "status": "pending",
             "link": link  # Store the link if provided
         }
-        task_ref.set(task)
-        await interaction.response.send_message(f"Task '{task_name}' created with ID: {task_ref.id}")
+        task_id = await task_store.create_task(interaction.guild_id, task)
+        await interaction.response.send_message(f"Task '{task_name}' created with ID: {task_id}")
     else:
         await interaction.response.send_message("You do not have permission to create tasks.", ephemeral=True)
 
 # Command to assign task to a role
 @bot.tree.command(name='assign-task', description='Assign a task to a role')
+@app_commands.autocomplete(task_id=task_id_autocomplete)
+@instrumented
 async def assign_task(interaction: discord.Interaction, task_id: str, role: discord.Role):
-    task_ref = db.collection('tasks').document(task_id)
-    task = task_ref.get()
-    if task.exists:
-        task_ref.update({"assigned_role": str(role.id)})
-        await interaction.response.send_message(f"Task '{task.get('task_name')}' assigned to role '{role.name}'")
+    task = await task_store.get_task(interaction.guild_id, task_id)
+    if task:
+        await task_store.update_task(interaction.guild_id, task_id, {"assigned_role": str(role.id)})
+        await interaction.response.send_message(f"Task '{task.task_name}' assigned to role '{role.name}'")
     else:
         await interaction.response.send_message(f"Task with ID {task_id} not found.")
 
-# Command to list all tasks
-@bot.tree.command(name='list-tasks', description='List tasks optionally filtered by assigned role')
-async def list_tasks(interaction: discord.Interaction, role: discord.Role = None):
-    tasks = db.collection('tasks').stream()
-    embed = discord.Embed(title="Tasks List", color=discord.Color.orange(), description="Here are your tasks:")
-
-    task_found = False
-
-    role_id = str(role.id) if role else None
-
-    for task in tasks:
-        task_data = task.to_dict()
-
-        if role_id is None or task_data['assigned_role'] == role_id:
-            due_date_str = task_data['due_date']
-
-            due_date_obj = datetime.fromtimestamp(int(due_date_str))
-
-            due_date_timestamp = int(due_date_obj.timestamp())
-
-            assigned_role = interaction.guild.get_role(int(task_data['assigned_role'])) if task_data['assigned_role'] else None
-            assigned_role_name = assigned_role.name if assigned_role else "None"
-
-            embed_value = (
-                f"**Name:** {task_data['task_name']}\n"
-                f"**Description:** {task_data['description']}\n"
-                f"**Due Date:** <t:{due_date_timestamp}:F>\n"  # Display as full date/time
-                f"**Assigned Role:** {assigned_role_name}\n"
-                f"**Status:** {task_data['status']}\n"
-            )
-
-            if task_data.get('link'):
-                embed_value += f"**Link:** [Click Here]({task_data['link']})\n"
+# Command to assign several tasks to a role in one batched write
+@bot.tree.command(name='assign-many', description='Assign several tasks to a role')
+@app_commands.autocomplete(task_ids=task_ids_autocomplete)
+@instrumented
+async def assign_many(interaction: discord.Interaction, task_ids: str, role: discord.Role):
+    task_ids = split_ids(task_ids)
+    if not task_ids or len(task_ids) > MAX_BULK_TASKS:
+        await interaction.response.send_message(f"Please provide between 1 and {MAX_BULK_TASKS} task IDs.", ephemeral=True)
+        return
 
-            embed.add_field(name=f"Task ID: {task.id}", value=embed_value, inline=False)
-            task_found = True
+    tasks = await task_store.get_tasks(interaction.guild_id, task_ids)
+    if tasks:
+        await task_store.update_tasks(interaction.guild_id, [task.id for task in tasks], {"assigned_role": str(role.id)})
 
-    if not task_found:
-        embed.description = "No tasks found." if role_id is None else f"No tasks found for role: {role.name}"
+    found = {task.id for task in tasks}
+    lines = [f"Task '{task.task_name}' assigned to role '{role.name}'" for task in tasks]
+    lines += [f"Task with ID {task_id} not found." for task_id in task_ids if task_id not in found]
+    await interaction.response.send_message("\n".join(lines))
 
-    await interaction.response.send_message(embed=embed)
+# Command to list all tasks
+@bot.tree.command(name='list-tasks', description='List tasks optionally filtered by assigned role and status')
+@instrumented
+async def list_tasks(interaction: discord.Interaction, role: discord.Role = None, status: Literal['pending', 'completed'] = None):
+    view = TaskListView(interaction.user.id, interaction.guild_id, role, status)
+    await view.load()
+
+    if view.paginated:
+        await interaction.response.send_message(embed=view.embed(interaction.guild), view=view)
+        view.message = await interaction.original_response()
+    else:
+        await interaction.response.send_message(embed=view.embed(interaction.guild))
 
 @bot.tree.command(name='submit-task', description='Submit your task')
+@app_commands.autocomplete(task_id=task_id_autocomplete)
+@instrumented
 async def submit_task(interaction: discord.Interaction, task_id: str, link: str):
     await interaction.response.defer(ephemeral=True)
 
-    task_ref = db.collection('tasks').document(task_id)
-    task = task_ref.get()
-
-    if task.exists:
-        receiver_ref = task_ref.collection('receivers').document(str(interaction.user.id))
-        receiver = receiver_ref.get()
-
-        if receiver.exists:
-            receiver_data = receiver.to_dict()
+    task = await task_store.get_task(interaction.guild_id, task_id)
 
-            if receiver_data.get('status') == 'completed':
-                await interaction.followup.send("You have already submitted this task.", ephemeral=True)
-                return
-
-            receiver_ref.update({
-                'status': 'completed',
-                'submission_link': link,
-                'submitted_at': datetime.now().timestamp()
-            })
-
-            await interaction.followup.send(f"Task '{task.get('task_name')}' submitted successfully with the link: {link}")
+    try:
+        result = await task_store.submit_task(interaction.guild_id, task_id, interaction.user.id, {
+            'task_name': task.task_name,
+            'status': 'completed',
+            'submission_link': link,
+            'submitted_at': datetime.now().timestamp()
+        }, task=task) if task else None
+    except task_store.TaskNotFound:
+        # Deleted since it was read
+        result = None
+
+    if result:
+        if result == task_store.SUBMITTED:
+            await interaction.followup.send(f"Task '{task.task_name}' submitted successfully with the link: {link}")
+        elif result == task_store.ALREADY_SUBMITTED:
+            await interaction.followup.send("You have already submitted this task.", ephemeral=True)
         else:
             await interaction.followup.send("Please use /receive to receive the task first.", ephemeral=True)
     else:
@@ -133,185 +234,383 @@ async def submit_task(interaction: discord.Interaction, task_id: str, link: str)
 
 # Command to mark a task as completed
 @bot.tree.command(name='complete-task', description='Mark a task as completed')
+@app_commands.autocomplete(task_id=task_id_autocomplete)
+@instrumented
 async def complete_task(interaction: discord.Interaction, task_id: str):
-    if not any(role.name in ['Seniors', 'mods'] for role in interaction.user.roles):
+    if not await has_access(interaction, STAFF_ROLES):
         await interaction.response.send_message("You do not have permission to use this command.", ephemeral=True)
         return
-    task_ref = db.collection('tasks').document(task_id)
-    task = task_ref.get()
-    if task.exists:
-        task_ref.update({"status": "completed"})
-        await interaction.response.send_message(f"Task '{task.get('task_name')}' marked as completed.")
+    task = await task_store.get_task(interaction.guild_id, task_id)
+    if task:
+        await task_store.update_task(interaction.guild_id, task_id, {"status": "completed"})
+        await interaction.response.send_message(f"Task '{task.task_name}' marked as completed.")
     else:
         await interaction.response.send_message(f"Task with ID {task_id} not found.")
 
 # Command to delete a task (restricted to users with the 'Head' role)
 @bot.tree.command(name='delete-task', description='Delete a task')
+@app_commands.autocomplete(task_id=task_id_autocomplete)
+@instrumented
 async def delete_task(interaction: discord.Interaction, task_id: str):
-    task_ref = db.collection('tasks').document(task_id)
-    task = task_ref.get()
-    if task.exists:
-        task_ref.delete()
+    task = await task_store.get_task(interaction.guild_id, task_id)
+    if task:
+        await task_store.delete_task(interaction.guild_id, task_id)
         await interaction.response.send_message(f"Task with ID {task_id} deleted.")
     else:
         await interaction.response.send_message(f"Task with ID {task_id} not found.")
 
-@bot.tree.command(name='announce', description='Make an announcement in a specified channel')
-async def announce(interaction: discord.Interaction, channel: discord.TextChannel, message: str, role: discord.Role = None):
-    required_roles = ['Seniors', 'mods']  # Specify the role names allowed to make announcements
-    if any(role.name in required_roles for role in interaction.user.roles):
-        try:
-            # Step 1: Check if the role is @everyone
-            if role and role.is_default():  # is_default() returns True if it's @everyone
-                await channel.send("@everyone")  # Send @everyone as a standalone message
-            elif role:  # If a specific role is provided (not @everyone)
-                await channel.send(role.mention)  # Send the role mention
-
-            # Step 2: Create and send the embedded message
-            embed = discord.Embed(
-                title="📢 Announcement",
-                description=message,  # Keep the original message
-                color=discord.Color.orange(),
-                timestamp=datetime.utcnow()
-            )
+@bot.tree.command(name='announce', description='Make an announcement in one or more channels')
+@instrumented
+async def announce(interaction: discord.Interaction, channel: discord.TextChannel, message: str, role: discord.Role = None, more_channels: str = None):
+    if not await has_access(interaction, STAFF_ROLES):
+        await interaction.response.send_message("You do not have permission to make announcements.", ephemeral=True)
+        return
 
-            await channel.send(embed=embed)  # Send the embedded announcement
+    channels = [channel]
+    unknown = []
+    for token in split_ids(more_channels or ""):
+        channel_id = token.removeprefix("<#").removesuffix(">")
+        extra = interaction.guild.get_channel(int(channel_id)) if channel_id.isdigit() else None
+        if isinstance(extra, discord.TextChannel):
+            channels.append(extra)
+        else:
+            unknown.append(token)
+    channels = list(dict.fromkeys(channels))
+    if len(channels) > MAX_ANNOUNCE_CHANNELS:
+        await interaction.response.send_message(f"Please pick at most {MAX_ANNOUNCE_CHANNELS} channels.", ephemeral=True)
+        return
 
-            # Acknowledge the interaction with an ephemeral message
-            await interaction.response.send_message(f"Announcement sent to {channel.mention}", ephemeral=True)
+    # Channels the bot can't post in are reported right away instead of being queued
+    forbidden = [c for c in channels if not c.permissions_for(interaction.guild.me).send_messages]
+    channels = [c for c in channels if c not in forbidden]
 
-        except discord.Forbidden:
-            await interaction.response.send_message("I do not have permission to send messages in that channel.", ephemeral=True)
-        except discord.HTTPException:
-            await interaction.response.send_message("Failed to send the message. Please try again later.", ephemeral=True)
+    embed = discord.Embed(
+        title="📢 Announcement",
+        description=message,  # Keep the original message
+        color=discord.Color.orange(),
+        timestamp=datetime.utcnow()
+    )
+    # The mention rides along with the embed in a single message; allowed_mentions makes
+    # sure it pings exactly the chosen role (or @everyone) and nothing in the text does
+    if role and role.is_default():
+        content, allowed_mentions = "@everyone", discord.AllowedMentions(everyone=True, roles=False, users=False)
+    elif role:
+        content, allowed_mentions = role.mention, discord.AllowedMentions(everyone=False, roles=[role], users=False)
     else:
-        await interaction.response.send_message("You do not have permission to make announcements.", ephemeral=True)
+        content, allowed_mentions = None, discord.AllowedMentions.none()
+
+    async def report(results):
+        sent = [c.mention for c, error in results if error is None]
+        lines = [f"Announcement sent to {', '.join(sent)}"] if sent else []
+        for c, error in results:
+            if isinstance(error, discord.Forbidden):
+                lines.append(f"I do not have permission to send messages in {c.mention}.")
+            elif error is not None:
+                lines.append(f"Failed to send the message to {c.mention}. Please try again later.")
+        await interaction.followup.send("\n".join(lines), ephemeral=True)
+
+    # Acknowledge straight away; the outcome follows once the queue has sent everything.
+    # The broadcast only starts afterwards, so report() never follows up on an interaction
+    # that hasn't been responded to yet.
+    lines = [f"Announcement queued for {', '.join(c.mention for c in channels)}"] if channels else []
+    lines += [f"I do not have permission to send messages in {c.mention}." for c in forbidden]
+    lines += [f"Unknown channel: {token}" for token in unknown]
+    await interaction.response.send_message("\n".join(lines), ephemeral=True)
+
+    if channels:
+        announcement_queue.broadcast(channels, on_done=report, content=content, embed=embed, allowed_mentions=allowed_mentions)
 
 
 @bot.tree.command(name='receive', description='To receive the task by individual members')
+@app_commands.autocomplete(task_id=task_id_autocomplete)
+@instrumented
 async def task_receive(interaction: discord.Interaction, role: discord.Role, task_id: str):
-    required_roles = ['Seniors', 'mods','Ninjas'] 
+    config = await task_store.fetch_guild_config(interaction.guild_id)
     user_name = interaction.user.display_name  
 
     await interaction.response.defer()
 
-    task_ref = db.collection('tasks').document(task_id)
-    task = task_ref.get()
+    task = await task_store.get_task(interaction.guild_id, task_id)
 
-    if task.exists:
-        task_data = task.to_dict()
-
-        if role.name in required_roles or task_data['assigned_role'] == str(role.id):
-            receivers_ref = task_ref.collection('receivers').document(str(interaction.user.id))  
-            
-            if not receivers_ref.get().exists:
-                receivers_ref.set({
+    if task:
+        if guild_config.role_matches(role, config, RECEIVER_ROLES) or task.assigned_role == str(role.id):
+            try:
+                received = await task_store.receive_task(interaction.guild_id, task_id, interaction.user.id, {
                     'user_name': user_name,
-                    'status': 'pending',  
-                    'received_at': datetime.now().timestamp()  
+                    'task_name': task.task_name,
+                    'status': 'pending',
+                    'received_at': datetime.now().timestamp()
                 })
+            except task_store.TaskNotFound:
+                # Deleted since it was read
+                await interaction.followup.send(f"Task with ID '{task_id}' not found.")
+                return
 
-                await interaction.followup.send(f"Task '{task_data['task_name']}' received by {user_name}.")
+            if received:
+                await interaction.followup.send(f"Task '{task.task_name}' received by {user_name}.")
             else:
-                await interaction.followup.send(f"You have already received the task '{task_data['task_name']}'.")
+                await interaction.followup.send(f"You have already received the task '{task.task_name}'.")
         else:
             await interaction.followup.send(f"You're not authorized to receive this task.")
     else:
         await interaction.followup.send(f"Task with ID '{task_id}' not found.")
 
+@bot.tree.command(name='receive-many', description='Receive several tasks at once')
+@app_commands.autocomplete(task_ids=task_ids_autocomplete)
+@instrumented
+async def task_receive_many(interaction: discord.Interaction, role: discord.Role, task_ids: str):
+    config = await task_store.fetch_guild_config(interaction.guild_id)
+    user_name = interaction.user.display_name
+
+    task_ids = split_ids(task_ids)
+    if not task_ids or len(task_ids) > MAX_BULK_TASKS:
+        await interaction.response.send_message(f"Please provide between 1 and {MAX_BULK_TASKS} task IDs.", ephemeral=True)
+        return
+
+    await interaction.response.defer()
+
+    tasks = {task.id: task for task in await task_store.get_tasks(interaction.guild_id, task_ids)}
+    authorized = {
+        task_id: task for task_id, task in tasks.items()
+        if guild_config.role_matches(role, config, RECEIVER_ROLES) or task.assigned_role == str(role.id)
+    }
+    received_at = datetime.now().timestamp()
+    received, missing = await task_store.receive_tasks(interaction.guild_id, interaction.user.id, {
+        task_id: {
+            'user_name': user_name,
+            'task_name': task.task_name,
+            'status': 'pending',
+            'received_at': received_at
+        }
+        for task_id, task in authorized.items()
+    }) if authorized else ([], [])
+    # Tasks deleted since they were read count as not found
+    for task_id in missing:
+        del tasks[task_id]
+        del authorized[task_id]
+
+    lines = [f"Received by {user_name}: {task_id} ({tasks[task_id].task_name})" for task_id in received]
+    lines += [f"Already received: {task_id}" for task_id in authorized if task_id not in received]
+    lines += [f"Not authorized: {task_id}" for task_id in tasks if task_id not in authorized]
+    lines += [f"Not found: {task_id}" for task_id in task_ids if task_id not in tasks]
+    await interaction.followup.send("\n".join(lines))
+
 @bot.tree.command(name='view-submissions', description='View all submitted tasks')
+@instrumented
 async def view_submissions(interaction: discord.Interaction):
     # Check if the user has the required 'Head' role
-    if not any(role.name == 'Seniors' for role in interaction.user.roles):
+    if not await has_access(interaction, HEAD_ROLES):
         await interaction.response.send_message("You do not have permission to use this command.", ephemeral=True)
         return
 
-    # Fetch all tasks
-    tasks = db.collection('tasks').stream()
+    # An embed holds at most 25 fields, so only that many are fetched;
+    # /export-submissions has the complete list
+    submissions = await task_store.list_submissions(interaction.guild_id, EMBED_FIELD_LIMIT)
     embed = discord.Embed(title="Submitted Tasks", color=discord.Color.blue())
 
     task_found = False
 
-    for task in tasks:
-        task_data = task.to_dict()
-        task_id = task.id
-        task_name = task_data.get("task_name", "N/A")
-
-        # Fetch submissions for each task
-        submissions = task.reference.collection('receivers').where('status', '==', 'completed').stream()
-
-        for submission in submissions:
-            submission_data = submission.to_dict()
-            username = submission_data.get('user_name', 'Unknown User')
-            submission_link = submission_data.get('submission_link', 'No link provided')
+    for submission in submissions:
+        username = submission.user_name or 'Unknown User'
+        submission_link = submission.submission_link or 'No link provided'
 
-            # Add submission details to embed
-            embed.add_field(
-                name=f"Task Name: {task_name} (ID: {task_id})",
-                value=f"**Username:** {username}\n**Link:** [Submission Link]({submission_link})",
-                inline=False
-            )
-            task_found = True
+        # Add submission details to embed
+        embed.add_field(
+            name=f"Task Name: {submission.task_name} (ID: {submission.task_id})",
+            value=f"**Username:** {username}\n**Link:** [Submission Link]({submission_link})",
+            inline=False
+        )
+        task_found = True
 
     if not task_found:
         embed.description = "No submitted tasks found."
+    else:
+        # Counted even for a short page: storage may drop rows of deleted tasks after
+        # applying the limit. Usually answered from the cached task counters.
+        total = await task_store.count_submissions(interaction.guild_id)
+        if total > len(submissions):
+            embed.set_footer(text=f"Showing {len(submissions)} of {total} submissions. Use /export-submissions for all of them.")
 
     await interaction.response.send_message(embed=embed)
 
 
+@bot.tree.command(name='export-submissions', description='Download receivers and submissions as a CSV or JSON file')
+@app_commands.autocomplete(task_id=task_id_autocomplete)
+@instrumented
+async def export_submissions(interaction: discord.Interaction, task_id: str = None, status: Literal['pending', 'completed'] = None, file_format: Literal['csv', 'json'] = 'csv'):
+    if not await has_access(interaction, HEAD_ROLES):
+        await interaction.response.send_message("You do not have permission to use this command.", ephemeral=True)
+        return
+
+    await interaction.response.defer(ephemeral=True)
+
+    if task_id and not await task_store.get_task(interaction.guild_id, task_id):
+        await interaction.followup.send(f"Task with ID {task_id} not found.", ephemeral=True)
+        return
+
+    # Rows go from storage through the CSV/JSON writer into a temporary file on a storage
+    # worker, so neither the event loop nor memory grows with the cohort
+    name = f"submissions-{task_id or 'all'}-{datetime.now():%Y%m%d-%H%M}"
+    file, filename, count = await task_store.stream_receivers(
+        interaction.guild_id,
+        partial(exports.export, file_format=file_format, name=name),
+        task_id=task_id,
+        status=status
+    )
+    with file:
+        size = file.seek(0, os.SEEK_END)
+        file.seek(0)
+        if size > interaction.guild.filesize_limit:
+            await interaction.followup.send(
+                f"The export ({count} rows) is too large to upload here. Try exporting one task or one status at a time.",
+                ephemeral=True
+            )
+            return
+        await interaction.followup.send(
+            f"Exported {count} rows.",
+            file=discord.File(file, filename=filename),
+            ephemeral=True
+        )
+
+
 @bot.tree.command(name='receive-list', description='Get the count of submissions and student names for a specific task')
+@app_commands.autocomplete(task_id=task_id_autocomplete)
+@instrumented
 async def receive_task(interaction: discord.Interaction, task_id: str):
     
-    if not any(role.name in ['Seniors', 'mods'] for role in interaction.user.roles):
+    if not await has_access(interaction, STAFF_ROLES):
         await interaction.response.send_message("You do not have permission to use this command.", ephemeral=True)
         return
     try:
         # Fetch the task with the given task ID
-        task_ref = db.collection('tasks').document(task_id)
-        task_snapshot = task_ref.get()
+        task = await task_store.get_task(interaction.guild_id, task_id)
 
         # Check if the task exists
-        if not task_snapshot.exists:
+        if not task:
             await interaction.response.send_message(f"Task with ID {task_id} not found.", ephemeral=True)
             return
 
-        # Get task details (name)
-        task_data = task_snapshot.to_dict()
-        task_name = task_data.get("task_name", "Unnamed Task")
-
-        # Get the submissions from the 'receivers' subcollection
-        receivers = task_ref.collection('receivers').stream()
-        receiver_names = []
-        count = 0
-
-        for receiver in receivers:
-            submission_data = receiver.to_dict()
-            user_name = submission_data.get('user_name', 'Unknown User')
-            receiver_names.append(user_name)
-            count += 1
-
-        # Create a column of student names (one name per line)
-        student_names = "\n".join(receiver_names) if receiver_names else "No submissions yet."
-
-        # Create the embed message
-        embed = discord.Embed(
-            title=f"Task: {task_name}",
-            description=f"Task ID: {task_id}",
-            color=discord.Color.orange()
-        )
-
-        # Add fields to embed
-        embed.add_field(name="Submissions Count", value=f"{count} submissions", inline=False)
-        embed.add_field(name="Students Who Submitted", value=student_names, inline=False)
+        # Counters are kept on the task document, so this is O(1) however many
+        # students received it; names are fetched one page at a time
+        counters = await task_store.receiver_counts(interaction.guild_id, task_id, task)
+        view = ReceiverListView(interaction.user.id, task, counters)
+        await view.load()
 
         # Send the embed message
-        await interaction.response.send_message(embed=embed)
+        if view.paginated:
+            await interaction.response.send_message(embed=view.embed(interaction.guild), view=view)
+            view.message = await interaction.original_response()
+        else:
+            await interaction.response.send_message(embed=view.embed(interaction.guild))
 
     except Exception as e:
         await interaction.response.send_message(f"An error occurred: {str(e)}", ephemeral=True)
 
 
 
+@bot.tree.command(name='leaderboard', description='Show the members who completed the most tasks')
+@instrumented
+async def leaderboard(interaction: discord.Interaction, limit: app_commands.Range[int, 1, 25] = 10):
+    members = [member for member in await task_store.leaderboard(interaction.guild_id, limit) if member.completed]
+
+    embed = discord.Embed(title="Leaderboard", color=discord.Color.orange())
+    if members:
+        embed.description = "\n".join(
+            f"**{rank}.** <@{member.id}> - {member.completed} completed ({member.on_time} on time, {member.late} late)"
+            for rank, member in enumerate(members, start=1)
+        )
+    else:
+        embed.description = "No tasks have been submitted yet."
+    await interaction.response.send_message(embed=embed)
+
+
+@bot.tree.command(name='my-tasks', description='Show how many tasks you have received and completed')
+@instrumented(ephemeral=True)
+async def my_tasks(interaction: discord.Interaction):
+    stats = await task_store.member_stats(interaction.guild_id, interaction.user.id)
+    if stats is None:
+        await interaction.response.send_message("You haven't received any tasks yet.", ephemeral=True)
+        return
+
+    embed = discord.Embed(title=f"Tasks of {interaction.user.display_name}", color=discord.Color.orange())
+    embed.add_field(name="Received", value=str(stats.received), inline=True)
+    embed.add_field(name="Completed", value=str(stats.completed), inline=True)
+    embed.add_field(name="Pending", value=str(stats.pending), inline=True)
+    embed.add_field(name="On time", value=str(stats.on_time), inline=True)
+    embed.add_field(name="Late", value=str(stats.late), inline=True)
+    await interaction.response.send_message(embed=embed, ephemeral=True)
+
+
+@bot.tree.command(name='bot-stats', description='Show per-command latency and storage usage')
+@instrumented(ephemeral=True)
+async def bot_stats(interaction: discord.Interaction):
+    if not await has_access(interaction, STAFF_ROLES):
+        await interaction.response.send_message("You do not have permission to use this command.", ephemeral=True)
+        return
+
+    embed = discord.Embed(title="Bot Stats", color=discord.Color.orange())
+    embed.description = f"Gateway latency: {bot.latency * 1000:.0f} ms"
+
+    def ms(seconds):
+        return "n/a" if seconds is None else f"{seconds * 1000:.0f} ms"
+
+    # Busiest commands first; an embed holds at most 25 fields
+    busiest = sorted(command_stats.items(), key=lambda item: item[1].invocations, reverse=True)[:25]
+    for name, stats in busiest:
+        embed.add_field(
+            name=f"/{name}",
+            value=(
+                f"**Calls:** {stats.invocations} ({stats.errors} errors)\n"
+                f"**Latency p50/p95:** {ms(stats.latency.percentile(0.5))} / {ms(stats.latency.percentile(0.95))}\n"
+                f"**First response p95:** {ms(stats.first_response.percentile(0.95))}\n"
+                f"**Auto-deferred / late:** {stats.auto_defers} / {stats.late_responses}\n"
+                f"**Storage ops/call:** {stats.storage_ops.total / stats.storage_ops.count:.1f}"
+            ),
+            inline=True
+        )
+
+    if not busiest:
+        embed.add_field(name="No data", value="No commands have run since startup.", inline=False)
+
+    await interaction.response.send_message(embed=embed, ephemeral=True)
+
+
+@bot.tree.command(name='configure-roles', description='Choose which roles have an access level in this server')
+@app_commands.default_permissions(manage_guild=True)
+@instrumented(ephemeral=True)
+async def configure_roles(interaction: discord.Interaction, level: Literal['head', 'staff', 'receivers'], role: discord.Role = None, role_2: discord.Role = None, role_3: discord.Role = None):
+    if not interaction.user.guild_permissions.manage_guild:
+        await interaction.response.send_message("You need the Manage Server permission to use this command.", ephemeral=True)
+        return
+
+    # No roles resets the level to its default role names
+    roles = [r for r in (role, role_2, role_3) if r is not None]
+    setting = guild_config.LEVELS[level]
+    await task_store.update_guild_config(interaction.guild_id, {
+        setting: list(dict.fromkeys(str(r.id) for r in roles)) or None
+    })
+    config = await task_store.fetch_guild_config(interaction.guild_id)
+    await interaction.response.send_message(
+        f"Roles with '{level}' access: {guild_config.describe(interaction.guild, config, setting)}",
+        ephemeral=True,
+        allowed_mentions=discord.AllowedMentions.none()
+    )
+
+@bot.tree.command(name='configure-reminders', description='Choose the channel for due-date reminders in this server')
+@app_commands.default_permissions(manage_guild=True)
+@instrumented(ephemeral=True)
+async def configure_reminders(interaction: discord.Interaction, channel: discord.TextChannel = None):
+    if not interaction.user.guild_permissions.manage_guild:
+        await interaction.response.send_message("You need the Manage Server permission to use this command.", ephemeral=True)
+        return
+
+    await task_store.update_guild_config(interaction.guild_id, {REMINDER_CHANNEL: str(channel.id) if channel else None})
+    if channel:
+        await interaction.response.send_message(f"Due-date reminders will be posted in {channel.mention}.", ephemeral=True)
+    else:
+        await interaction.response.send_message("Reminder channel reset to the default.", ephemeral=True)
+
+
 # Command to update task description or due date
 # @bot.tree.command(name='update-task', description='Update task description or due date')
 # async def update_task(interaction: discord.Interaction, task_id: str, new_description: str, new_due_date: str):
@@ -334,6 +633,7 @@ async def receive_task(interaction: discord.Interaction, task_id: str):
 
 # Register commands with the Discord server
 @bot.tree.command(name='help', description='Displays the list of available commands')
+@instrumented
 async def help_command(interaction: discord.Interaction):
     embed = discord.Embed(
         title="Bot Commands",
@@ -367,13 +667,26 @@ async def help_command(interaction: discord.Interaction):
         inline=False
     )
 
+    embed.add_field(
+        name="/assign-many",
+        value=(
+            "**Description**: Assign several tasks to a specific role.\n"
+            "**Usage**: `/assign-many task_ids role`\n"
+            "**Parameters**:\n"
+            f"- `task_ids` (required): Up to {MAX_BULK_TASKS} task IDs separated by commas or spaces.\n"
+            "- `role` (required): The role to which the tasks will be assigned."
+        ),
+        inline=False
+    )
+
     embed.add_field(
         name="/list-tasks",
         value=(
-            "**Description**: List all tasks, optionally filtered by a role.\n"
-            "**Usage**: `/list-tasks [role]`\n"
+            "**Description**: List all tasks, optionally filtered by a role and status. Results are paged by due date.\n"
+            "**Usage**: `/list-tasks [role] [status]`\n"
             "**Parameters**:\n"
-            "- `role` (optional): Filter tasks assigned to a specific role. If omitted, all tasks are shown."
+            "- `role` (optional): Filter tasks assigned to a specific role. If omitted, all tasks are shown.\n"
+            "- `status` (optional): Only show `pending` or `completed` tasks."
         ),
         inline=False
     )
@@ -415,12 +728,13 @@ async def help_command(interaction: discord.Interaction):
     embed.add_field(
         name="/announce",
         value=(
-            "**Description**: Make an announcement in a specified channel.\n"
-            "**Usage**: `/announce channel message [role]`\n"
+            "**Description**: Make an announcement in one or more channels.\n"
+            "**Usage**: `/announce channel message [role] [more_channels]`\n"
             "**Parameters**:\n"
             "- `channel` (required): The text channel where the announcement will be made.\n"
             "- `message` (required): The announcement text.\n"
-            "- `role` (optional): Mention a specific role or use `@everyone`."
+            "- `role` (optional): Mention a specific role or use `@everyone`.\n"
+            f"- `more_channels` (optional): Further channels to post in (mentions separated by spaces), up to {MAX_ANNOUNCE_CHANNELS} in total."
         ),
         inline=False
     )
@@ -437,6 +751,18 @@ async def help_command(interaction: discord.Interaction):
         inline=False
     )
 
+    embed.add_field(
+        name="/receive-many",
+        value=(
+            "**Description**: Receive several tasks at once.\n"
+            "**Usage**: `/receive-many role task_ids`\n"
+            "**Parameters**:\n"
+            "- `role` (required): The role you belong to or are assigned to.\n"
+            f"- `task_ids` (required): Up to {MAX_BULK_TASKS} task IDs separated by commas or spaces."
+        ),
+        inline=False
+    )
+
     embed.add_field(
         name="/view-submissions",
         value=(
@@ -447,6 +773,19 @@ async def help_command(interaction: discord.Interaction):
         inline=False
     )
 
+    embed.add_field(
+        name="/export-submissions",
+        value=(
+            "**Description**: Download receivers and submissions as a file (restricted to 'Head' role). Large files are gzipped.\n"
+            "**Usage**: `/export-submissions [task_id] [status] [file_format]`\n"
+            "**Parameters**:\n"
+            "- `task_id` (optional): Only export this task. If omitted, every task is exported.\n"
+            "- `status` (optional): Only export `pending` or `completed` receivers.\n"
+            "- `file_format` (optional): `csv` (default) or `json`."
+        ),
+        inline=False
+    )
+
     embed.add_field(
         name="/receive-list",
         value=(
@@ -458,45 +797,119 @@ async def help_command(interaction: discord.Interaction):
         inline=False
     )
 
+    embed.add_field(
+        name="/leaderboard",
+        value=(
+            "**Description**: Show the members who completed the most tasks, with how many were on time or late.\n"
+            "**Usage**: `/leaderboard [limit]`\n"
+            "**Parameters**:\n"
+            "- `limit` (optional): How many members to show, 1 to 25 (default 10)."
+        ),
+        inline=False
+    )
+
+    embed.add_field(
+        name="/my-tasks",
+        value=(
+            "**Description**: Show how many tasks you have received, completed (on time or late) and still have pending.\n"
+            "**Usage**: `/my-tasks`\n"
+            "**Parameters**: None."
+        ),
+        inline=False
+    )
+
+    embed.add_field(
+        name="/bot-stats",
+        value=(
+            "**Description**: Show per-command latency, error and storage usage stats (restricted to staff roles).\n"
+            "**Usage**: `/bot-stats`\n"
+            "**Parameters**: None."
+        ),
+        inline=False
+    )
+
+    embed.add_field(
+        name="/configure-roles",
+        value=(
+            "**Description**: Choose which roles have an access level in this server (requires Manage Server).\n"
+            "**Usage**: `/configure-roles level [role] [role_2] [role_3]`\n"
+            "**Parameters**:\n"
+            "- `level` (required): `head` (view submissions), `staff` (manage tasks and announcements) or `receivers` (receive any task).\n"
+            "- `role`, `role_2`, `role_3` (optional): The roles to grant the level. Leave empty to restore the defaults."
+        ),
+        inline=False
+    )
+
+    embed.add_field(
+        name="/configure-reminders",
+        value=(
+            "**Description**: Choose the channel where due-date reminders are posted (requires Manage Server).\n"
+            "**Usage**: `/configure-reminders [channel]`\n"
+            "**Parameters**:\n"
+            "- `channel` (optional): The reminder channel. Leave empty to restore the default."
+        ),
+        inline=False
+    )
+
     await interaction.response.send_message(embed=embed)
 
 
 
 # Event listener to handle a hidden command
+LUND_REPLY = "yaha se lund phek ke maarunga pura parivar chud jayega pata bhi nhi chalega"
+message_triggers = MessageTriggers({
+    "/lund": [LUND_REPLY],
+    "/machuda": [LUND_REPLY, "bhej teri maa ko"],
+})
+
+if MESSAGE_TRIGGERS:
+    @bot.event
+    async def on_message(message):
+        # Ignore messages sent by the bot itself. All commands are slash commands, so
+        # there are no prefix commands to process.
+        if message.author.id == bot.user.id:
+            return
+        await message_triggers.dispatch(message)
+
 @bot.event
-async def on_message(message):
-    # Ignore messages sent by the bot itself
-    if message.author == bot.user:
-        return
+async def on_ready():
+    # With AutoShardedBot this runs once every shard of this process is ready. It runs
+    # again after reconnects that couldn't resume the session; only guilds that aren't
+    # watched yet are loaded then, and the scheduler is already running.
+    await task_store.warm_cache([guild.id for guild in bot.guilds])
+    reminder_scheduler.start(task_store.cache)
+    print(f"Logged in as {bot.user}.")
+
+# Runs once per process, after login and before the gateway connects, so reconnects
+# never sync again
+@bot.event
+async def setup_hook():
+    await sync_commands(bot)
 
-    # Check if the message starts with /lund
-    if message.content.strip() == "/lund" or message.content.strip() == "/machuda":
-        # Send the response and delete it after 15 seconds
-        await message.channel.send(
-            "yaha se lund phek ke maarunga pura parivar chud jayega pata bhi nhi chalega",
-            delete_after=15
-        )
-        # Delete the original /lund command message
-        await message.delete()
-
-    # Check if the message starts with /machuda
-    if message.content.strip() == "/machuda":
-        # Send the response and delete it after 15 seconds
-        await message.channel.send(
-            "bhej teri maa ko",
-            delete_after=15
-        )
-        # Delete the original /machuda command message
-        await message.delete(delay = 15)
+@bot.event
+async def on_guild_join(guild):
+    await task_store.watch_guild(guild.id)
 
-    # Ensure other commands still work
-    await bot.process_commands(message)
-    
 @bot.event
-async def on_ready():
-    await bot.tree.sync()
-    print(f"Logged in as {bot.user} and synced commands.")
+async def on_guild_remove(guild):
+    await task_store.unwatch_guild(guild.id)
+
+# Start the bot and the health/metrics endpoint on the same event loop
+async def main():
+    discord.utils.setup_logging()
+    # Storage engine is picked from STORAGE_BACKEND (Firestore by default). It connects
+    # on a storage worker while the bot logs in, rather than at import, so tools can
+    # import the commands without credentials. connect() logs its own failure; the
+    # first storage call then retries.
+    task_store.init()
+    connecting = asyncio.create_task(task_store.connect())
+    async with bot:
+        web_runner = await keep_alive(bot)
+        try:
+            await bot.start(DISCORD_TOKEN)
+        finally:
+            connecting.cancel()
+            await web_runner.cleanup()
 
-# Start the bot
-keep_alive()
-bot.run(DISCORD_TOKEN)
+if __name__ == "__main__":
+    asyncio.run(main())
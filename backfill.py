@@ -0,0 +1,34 @@
+"""One-shot backfill of the per-member stats behind /leaderboard and /my-tasks.
+
+Receives and submits keep the stats up to date as they happen; this recounts them from
+the receivers written before the stats existed. Stop the bot first: on Firestore a
+receive or submit landing while a guild is recounted would be overwritten.
+
+    python backfill.py GUILD_ID [GUILD_ID ...]
+
+Uses the storage engine selected by STORAGE_BACKEND, like the bot. Running it again is
+harmless.
+"""
+import argparse
+import sys
+
+from dotenv import load_dotenv
+
+import storage
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("guild_ids", nargs="+", help="IDs of the guilds to backfill")
+    args = parser.parse_args(argv)
+
+    load_dotenv()
+    backend = storage.create_backend()
+    for guild_id in args.guild_ids:
+        members = backend.rebuild_member_stats(guild_id)
+        print(f"Guild {guild_id}: stats of {members} members rebuilt")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,301 @@
+"""Offline benchmark for the slash commands.
+
+Imports the command callbacks from app.py without connecting to Discord, runs them
+against fake interactions and an in-memory SQLite store, and reports throughput and
+latency per command for every combination of dataset size and concurrency:
+
+    python benchmark.py --tasks 50,500 --receivers 100,2000 --concurrency 1,16
+
+With --max-p95-ms it exits non-zero when any command's p95 latency exceeds the limit,
+so it can gate performance regressions.
+"""
+import argparse
+import asyncio
+import itertools
+import os
+import random
+import sys
+import time
+from types import SimpleNamespace
+
+os.environ.setdefault("STORAGE_BACKEND", "sqlite")
+
+import discord
+
+import app
+import task_store
+from instrumentation import command_stats
+from storage.sqlite_backend import SQLiteBackend
+
+
+GUILD_ID = 1000
+STAFF_ROLE_ID = 1001
+MEMBER_ROLE_ID = 1002
+STUDENT_BASE_ID = 10 ** 6
+COMMANDS = ("list-tasks", "view-submissions", "receive-list", "receive", "submit-task", "leaderboard", "my-tasks")
+
+
+# Fakes covering the parts of discord.py the command handlers touch
+
+class FakeRole:
+    def __init__(self, role_id, name):
+        self.id = role_id
+        self.name = name
+        self.mention = f"<@&{role_id}>"
+
+    def is_default(self):
+        return False
+
+
+class FakeMember:
+    def __init__(self, user_id, roles):
+        self.id = user_id
+        self.display_name = f"user-{user_id}"
+        self.mention = f"<@{user_id}>"
+        self.roles = roles
+        self.guild_permissions = discord.Permissions.none()
+
+
+class FakeGuild:
+    def __init__(self, roles):
+        self.id = GUILD_ID
+        self._roles = {role.id: role for role in roles}
+        self.filesize_limit = 25 * 1024 * 1024
+
+    def get_role(self, role_id):
+        return self._roles.get(role_id)
+
+    def get_channel(self, channel_id):
+        return None
+
+
+class FakeResponse:
+    def __init__(self):
+        self._done = False
+
+    def is_done(self):
+        return self._done
+
+    async def send_message(self, content=None, **kwargs):
+        self._done = True
+
+    async def defer(self, **kwargs):
+        self._done = True
+
+    async def edit_message(self, **kwargs):
+        self._done = True
+
+
+class FakeFollowup:
+    async def send(self, content=None, **kwargs):
+        return None
+
+
+class FakeInteraction:
+    type = discord.InteractionType.application_command
+
+    def __init__(self, command_name, user, guild):
+        self.command = SimpleNamespace(qualified_name=command_name)
+        self.created_at = discord.utils.utcnow()
+        self.user = user
+        self.guild = guild
+        self.guild_id = guild.id
+        self.followup = FakeFollowup()
+        # Read through the same cached slot as discord.Interaction.response, which
+        # responses.track replaces with its proxy
+        self._cs_response = FakeResponse()
+
+    @property
+    def response(self):
+        return self._cs_response
+
+    async def original_response(self):
+        return None
+
+    async def edit_original_response(self, **kwargs):
+        return None
+
+
+# Dataset
+
+async def seed(task_count, receiver_count):
+    # task_count tasks assigned to the member role; the first receiver_count students
+    # received every task and half of them submitted
+    task_names = {}
+    for number in range(task_count):
+        task_id = await task_store.create_task(GUILD_ID, {
+            "task_name": f"Task {number}",
+            "description": "Benchmark task " * 10,
+            "due_date": int(time.time()) + 86400 * (number % 30),
+            "assigned_role": str(MEMBER_ROLE_ID),
+            "status": "pending",
+            "link": None,
+        })
+        task_names[task_id] = f"Task {number}"
+
+    now = time.time()
+    for student in range(receiver_count):
+        user_id = STUDENT_BASE_ID + student
+        await task_store.receive_tasks(GUILD_ID, user_id, {
+            task_id: {"user_name": f"user-{user_id}", "task_name": name, "status": "pending", "received_at": now}
+            for task_id, name in task_names.items()
+        })
+        if student % 2 == 0:
+            for task_id in task_names:
+                await task_store.submit_task(GUILD_ID, task_id, user_id, {
+                    "status": "completed", "submission_link": "https://example.com", "submitted_at": now
+                })
+    return list(task_names)
+
+
+# Scenarios: each returns the argument factory for one invocation
+
+def scenarios(task_ids, receiver_count, staff, member_role):
+    new_students = itertools.count(STUDENT_BASE_ID + receiver_count)
+    # Students who received everything but haven't submitted (odd numbers)
+    unsubmitted = itertools.cycle(
+        (STUDENT_BASE_ID + student, task_id)
+        for student in range(1, receiver_count, 2) for task_id in task_ids
+    ) if receiver_count > 1 else None
+
+    def list_tasks():
+        return staff, {"role": random.choice([None, member_role])}
+
+    def view_submissions():
+        return staff, {}
+
+    def receive_list():
+        return staff, {"task_id": random.choice(task_ids)}
+
+    def receive():
+        student = FakeMember(next(new_students), [member_role])
+        return student, {"role": member_role, "task_id": random.choice(task_ids)}
+
+    def submit_task():
+        if unsubmitted is None:
+            student = FakeMember(next(new_students), [member_role])
+            return student, {"task_id": random.choice(task_ids), "link": "https://example.com"}
+        user_id, task_id = next(unsubmitted)
+        return FakeMember(user_id, [member_role]), {"task_id": task_id, "link": "https://example.com"}
+
+    def leaderboard():
+        return staff, {"limit": 10}
+
+    def my_tasks():
+        return FakeMember(STUDENT_BASE_ID + random.randrange(max(receiver_count, 1)), [member_role]), {}
+
+    return {
+        "list-tasks": list_tasks,
+        "view-submissions": view_submissions,
+        "receive-list": receive_list,
+        "receive": receive,
+        "submit-task": submit_task,
+        "leaderboard": leaderboard,
+        "my-tasks": my_tasks,
+    }
+
+
+def percentile(samples, fraction):
+    return samples[min(len(samples) - 1, int(fraction * len(samples)))]
+
+
+async def run_command(name, make_args, guild, calls, concurrency):
+    callback = app.bot.tree.get_command(name).callback
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+
+    async def invoke():
+        async with semaphore:
+            user, kwargs = make_args()
+            interaction = FakeInteraction(name, user, guild)
+            started = time.perf_counter()
+            await callback(interaction, **kwargs)
+            latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(invoke() for _ in range(calls)))
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    storage_ops = command_stats[name].storage_ops
+    return {
+        "command": name,
+        "calls": calls,
+        "throughput": calls / elapsed,
+        "p50": percentile(latencies, 0.5),
+        "p95": percentile(latencies, 0.95),
+        "max": latencies[-1],
+        "storage_ops": storage_ops.total / storage_ops.count if storage_ops.count else 0.0,
+    }
+
+
+async def run(task_count, receiver_count, concurrency, calls, commands, cold):
+    backend = SQLiteBackend(":memory:")
+    task_store.init(backend)
+    command_stats.clear()
+    member_role = FakeRole(MEMBER_ROLE_ID, "Students")
+    staff_role = FakeRole(STAFF_ROLE_ID, "Seniors")
+    guild = FakeGuild([member_role, staff_role])
+    staff = FakeMember(1, [staff_role])
+
+    if not cold:
+        await task_store.warm_cache([GUILD_ID])
+    task_ids = await seed(task_count, receiver_count)
+    if cold:
+        # Seeding caches the tasks it creates
+        task_store.cache.drop_guild(str(GUILD_ID))
+    factories = scenarios(task_ids, receiver_count, staff, member_role)
+
+    results = [
+        await run_command(name, factories[name], guild, calls, concurrency)
+        for name in commands
+    ]
+    await task_store.unwatch_guild(GUILD_ID)
+    backend.close()
+    return results
+
+
+def parse_sizes(raw):
+    return [int(value) for value in raw.split(",") if value.strip()]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--tasks", default="50", help="comma separated task counts")
+    parser.add_argument("--receivers", default="200", help="comma separated receivers per task")
+    parser.add_argument("--concurrency", default="1,16", help="comma separated concurrency levels")
+    parser.add_argument("--calls", type=int, default=200, help="invocations per command")
+    parser.add_argument("--commands", default=",".join(COMMANDS), help="comma separated command names")
+    parser.add_argument("--cold", action="store_true", help="skip the cache warm-up so reads hit storage")
+    parser.add_argument("--max-p95-ms", type=float, help="fail if any command's p95 latency exceeds this")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    random.seed(args.seed)
+    commands = [name.strip() for name in args.commands.split(",") if name.strip()]
+    unknown = set(commands) - set(COMMANDS)
+    if unknown:
+        parser.error(f"unknown commands: {', '.join(sorted(unknown))}")
+
+    failed = False
+    header = f"{'command':<18}{'calls':>7}{'ops/s':>10}{'p50 ms':>9}{'p95 ms':>9}{'max ms':>9}{'storage/call':>14}"
+    for task_count, receiver_count, concurrency in itertools.product(
+        parse_sizes(args.tasks), parse_sizes(args.receivers), parse_sizes(args.concurrency)
+    ):
+        results = asyncio.run(run(task_count, receiver_count, concurrency, args.calls, commands, args.cold))
+        print(f"\n{task_count} tasks x {receiver_count} receivers, concurrency {concurrency}"
+              f"{' (cold cache)' if args.cold else ''}")
+        print(header)
+        for result in results:
+            print(
+                f"{result['command']:<18}{result['calls']:>7}{result['throughput']:>10.0f}"
+                f"{result['p50'] * 1000:>9.2f}{result['p95'] * 1000:>9.2f}{result['max'] * 1000:>9.2f}"
+                f"{result['storage_ops']:>14.1f}"
+            )
+            if args.max_p95_ms is not None and result["p95"] * 1000 > args.max_p95_ms:
+                failed = True
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
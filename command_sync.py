@@ -0,0 +1,75 @@
+import hashlib
+import json
+import logging
+import os
+
+import discord
+
+
+log = logging.getLogger("cn_bot.sync")
+
+# Hashes of the command payloads last synced from this machine. Syncing is slow and
+# heavily rate-limited, so it only happens when the commands actually changed.
+COMMAND_HASH_PATH = os.getenv("COMMAND_HASH_PATH", ".command_tree.json")
+# Comma separated guild IDs. When set, commands are synced to these guilds only, where
+# changes show up immediately (global commands can take a while to propagate), and the
+# global commands are cleared so they don't show up twice in those guilds.
+SYNC_GUILD_IDS = [int(guild_id) for guild_id in os.getenv("SYNC_GUILD_IDS", "").split(",") if guild_id.strip()]
+
+
+def tree_hash(tree, guild=None):
+    payload = [command.to_dict(tree) for command in tree.get_commands(guild=guild)]
+    payload.sort(key=lambda command: command["name"])
+    return hashlib.sha256(json.dumps(payload, sort_keys=True).encode()).hexdigest()
+
+
+def _load():
+    try:
+        with open(COMMAND_HASH_PATH) as file:
+            return json.load(file)
+    except (OSError, ValueError):
+        return {}
+
+
+def _save(hashes):
+    temporary = f"{COMMAND_HASH_PATH}.tmp"
+    with open(temporary, "w") as file:
+        json.dump(hashes, file, indent=2, sort_keys=True)
+    os.replace(temporary, COMMAND_HASH_PATH)
+
+
+async def sync_commands(bot):
+    # Registers the command tree with Discord unless the same payload was already synced.
+    # Sharded deployments leave it to the process running shard 0.
+    shard_ids = getattr(bot, "shard_ids", None)
+    if shard_ids is not None and 0 not in shard_ids:
+        return
+
+    targets = [discord.Object(id=guild_id) for guild_id in SYNC_GUILD_IDS]
+    for guild in targets:
+        bot.tree.copy_global_to(guild=guild)
+    if targets:
+        # The guild copies answer the interactions from here on; syncing the now empty
+        # global tree removes commands an earlier global sync registered
+        bot.tree.clear_commands(guild=None)
+    hashes = _load()
+    changed = False
+    for guild in targets + [None]:
+        key = f"{bot.application_id}:{guild.id if guild else 'global'}"
+        digest = tree_hash(bot.tree, guild)
+        if hashes.get(key) == digest:
+            continue
+        try:
+            synced = await bot.tree.sync(guild=guild)
+        except discord.HTTPException:
+            log.exception("Failed to sync commands to %s", key)
+            continue
+        log.info("Synced %d commands to %s", len(synced), key)
+        hashes[key] = digest
+        changed = True
+
+    if changed:
+        try:
+            _save(hashes)
+        except OSError:
+            log.warning("Could not write %s; commands will be synced again next start", COMMAND_HASH_PATH)
@@ -0,0 +1,88 @@
+import csv
+import gzip
+import io
+import json
+import os
+import shutil
+import tempfile
+from datetime import datetime, timezone
+
+
+# Receivers are streamed from storage straight into a spooled temporary file, which
+# stays in memory while small and moves to disk beyond EXPORT_SPOOL_BYTES, so an export
+# costs the same memory whatever the cohort size.
+EXPORT_SPOOL_BYTES = int(os.getenv("EXPORT_SPOOL_BYTES", str(1024 * 1024)))
+# Files larger than this are gzipped before they are attached
+EXPORT_COMPRESS_OVER = int(os.getenv("EXPORT_COMPRESS_OVER", str(1024 * 1024)))
+COPY_CHUNK = 64 * 1024
+
+FIELDS = ("task_id", "task_name", "user_id", "user_name", "status", "submission_link", "received_at", "submitted_at")
+
+
+def _timestamp(value):
+    return datetime.fromtimestamp(value, timezone.utc).isoformat() if value else None
+
+
+def rows(receivers):
+    for receiver in receivers:
+        yield {
+            "task_id": receiver.task_id,
+            "task_name": receiver.task_name,
+            "user_id": receiver.id,
+            "user_name": receiver.user_name,
+            "status": receiver.status,
+            "submission_link": receiver.submission_link,
+            "received_at": _timestamp(receiver.received_at),
+            "submitted_at": _timestamp(receiver.submitted_at),
+        }
+
+
+def write_csv(records, text):
+    writer = csv.DictWriter(text, fieldnames=FIELDS)
+    writer.writeheader()
+    count = 0
+    for record in records:
+        writer.writerow(record)
+        count += 1
+    return count
+
+
+def write_json(records, text):
+    # A JSON array written one element at a time
+    count = 0
+    text.write("[")
+    for record in records:
+        text.write(",\n" if count else "\n")
+        json.dump(record, text, ensure_ascii=False)
+        count += 1
+    text.write("\n]\n" if count else "]\n")
+    return count
+
+
+WRITERS = {"csv": write_csv, "json": write_json}
+
+
+def _compress(source):
+    compressed = tempfile.SpooledTemporaryFile(max_size=EXPORT_SPOOL_BYTES)
+    source.seek(0)
+    with gzip.GzipFile(fileobj=compressed, mode="wb") as archive:
+        shutil.copyfileobj(source, archive, COPY_CHUNK)
+    source.close()
+    return compressed
+
+
+def export(receivers, file_format, name):
+    # Blocking; consumes the receivers iterable once. Returns (file, filename, count)
+    # with the file positioned at its start; the caller closes it.
+    output = tempfile.SpooledTemporaryFile(max_size=EXPORT_SPOOL_BYTES)
+    text = io.TextIOWrapper(output, encoding="utf-8", newline="")
+    count = WRITERS[file_format](rows(receivers), text)
+    text.flush()
+    text.detach()
+
+    filename = f"{name}.{file_format}"
+    if output.tell() > EXPORT_COMPRESS_OVER:
+        output = _compress(output)
+        filename += ".gz"
+    output.seek(0)
+    return output, filename, count
@@ -0,0 +1,40 @@
+# Per-guild settings, kept in the task store next to the guild's tasks. Privileged
+# roles are stored as lists of role IDs per access level; a guild that hasn't configured
+# a level falls back to the role names the bot was originally written for.
+HEAD_ROLES = "head_roles"
+STAFF_ROLES = "staff_roles"
+RECEIVER_ROLES = "receiver_roles"
+REMINDER_CHANNEL = "reminder_channel_id"
+
+DEFAULT_ROLES = {
+    # /view-submissions
+    HEAD_ROLES: ("Seniors",),
+    # creating, completing and listing receivers of tasks, announcements, /bot-stats
+    STAFF_ROLES: ("Seniors", "mods"),
+    # roles that may receive any task, not just the ones assigned to them
+    RECEIVER_ROLES: ("Seniors", "mods", "Ninjas"),
+}
+
+# /configure-roles level choices
+LEVELS = {
+    "head": HEAD_ROLES,
+    "staff": STAFF_ROLES,
+    "receivers": RECEIVER_ROLES,
+}
+
+
+def role_matches(role, config, level):
+    entries = config.get(level) or DEFAULT_ROLES[level]
+    return str(role.id) in entries or role.name in entries
+
+
+def member_has(member, config, level):
+    return any(role_matches(role, config, level) for role in member.roles)
+
+
+def describe(guild, config, level):
+    # Human-readable list of the roles granting a level
+    if not config.get(level):
+        return ", ".join(f"'{name}'" for name in DEFAULT_ROLES[level]) + " (default)"
+    roles = [guild.get_role(int(role_id)) for role_id in config[level]]
+    return ", ".join(role.mention for role in roles if role is not None) or "None"
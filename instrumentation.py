@@ -0,0 +1,189 @@
+import functools
+import json
+import logging
+import time
+from bisect import bisect_left
+from collections import defaultdict, deque
+from contextvars import ContextVar
+
+import discord
+
+import responses
+
+
+log = logging.getLogger("cn_bot.commands")
+
+# Upper bounds (seconds) of the Prometheus histogram buckets
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.0, 3.0, 5.0, 10.0)
+STORAGE_OPS_BUCKETS = (0, 1, 2, 3, 5, 10, 25, 50, 100, 250)
+# Recent samples kept per command for the percentiles shown by /bot-stats
+RECENT_SAMPLES = 512
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.total = 0.0
+        self.count = 0
+        self.recent = deque(maxlen=RECENT_SAMPLES)
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.total += value
+        self.count += 1
+        self.recent.append(value)
+
+    def percentile(self, fraction):
+        if not self.recent:
+            return None
+        ordered = sorted(self.recent)
+        return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+    def prometheus(self, name, labels):
+        lines, cumulative = [], 0
+        for bound, count in zip(self.buckets, self.counts):
+            cumulative += count
+            lines.append(f'{name}_bucket{{{labels},le="{bound}"}} {cumulative}')
+        lines.append(f'{name}_bucket{{{labels},le="+Inf"}} {self.count}')
+        lines.append(f"{name}_sum{{{labels}}} {self.total}")
+        lines.append(f"{name}_count{{{labels}}} {self.count}")
+        return lines
+
+
+class CommandStats:
+    def __init__(self):
+        self.invocations = 0
+        self.errors = 0
+        self.latency = Histogram(LATENCY_BUCKETS)
+        self.first_response = Histogram(LATENCY_BUCKETS)
+        self.storage_ops = Histogram(STORAGE_OPS_BUCKETS)
+        self.storage_seconds = 0.0
+        self.auto_defers = 0
+        self.late_responses = 0
+
+
+# State of one command invocation, reachable from anywhere in its task via a ContextVar
+class Invocation:
+    __slots__ = ("command", "created_at", "started", "first_response", "storage_ops", "storage_seconds")
+
+    def __init__(self, command, created_at):
+        self.command = command
+        self.created_at = created_at
+        self.started = time.perf_counter()
+        self.first_response = None
+        self.storage_ops = 0
+        self.storage_seconds = 0.0
+
+    def responded(self):
+        # Measured from the interaction's creation, which is what Discord's 3 second
+        # acknowledgement deadline counts from.
+        if self.first_response is None:
+            self.first_response = (discord.utils.utcnow() - self.created_at).total_seconds()
+
+
+_current = ContextVar("invocation", default=None)
+command_stats = defaultdict(CommandStats)
+storage_stats = defaultdict(lambda: [0, 0.0])  # operation -> [count, seconds]
+
+
+def record_storage_op(operation, seconds):
+    stats = storage_stats[operation]
+    stats[0] += 1
+    stats[1] += seconds
+    invocation = _current.get()
+    if invocation is not None:
+        invocation.storage_ops += 1
+        invocation.storage_seconds += seconds
+
+
+def instrumented(func=None, *, ephemeral=False):
+    # Goes directly under @bot.tree.command. functools.wraps keeps the signature
+    # discord.py reads the slash command parameters from. Besides recording metrics it
+    # installs the deadline-aware response layer (see responses.py); commands that only
+    # reply ephemerally use @instrumented(ephemeral=True) so an auto-defer is too.
+    if func is None:
+        return functools.partial(instrumented, ephemeral=ephemeral)
+
+    @functools.wraps(func)
+    async def wrapper(interaction: discord.Interaction, *args, **kwargs):
+        command = interaction.command.qualified_name if interaction.command else func.__name__
+        invocation = Invocation(command, interaction.created_at)
+        token = _current.set(invocation)
+        response = responses.track(interaction, on_first_response=invocation.responded, ephemeral=ephemeral)
+        error = None
+        try:
+            return await func(interaction, *args, **kwargs)
+        except Exception as exc:
+            error = exc
+            raise
+        finally:
+            response.disarm()
+            _current.reset(token)
+            _finish(invocation, interaction, error, response.auto_deferred)
+
+    return wrapper
+
+
+def _finish(invocation, interaction, error, auto_deferred):
+    latency = time.perf_counter() - invocation.started
+    stats = command_stats[invocation.command]
+    stats.invocations += 1
+    if error is not None:
+        stats.errors += 1
+    stats.latency.observe(latency)
+    if invocation.first_response is not None:
+        stats.first_response.observe(invocation.first_response)
+        if invocation.first_response > responses.INTERACTION_DEADLINE:
+            stats.late_responses += 1
+    if auto_deferred:
+        stats.auto_defers += 1
+    stats.storage_ops.observe(invocation.storage_ops)
+    stats.storage_seconds += invocation.storage_seconds
+
+    log.info(json.dumps({
+        "event": "command",
+        "command": invocation.command,
+        "guild_id": interaction.guild_id,
+        "user_id": interaction.user.id,
+        "latency_ms": round(latency * 1000, 2),
+        "first_response_ms": None if invocation.first_response is None else round(invocation.first_response * 1000, 2),
+        "storage_ops": invocation.storage_ops,
+        "storage_ms": round(invocation.storage_seconds * 1000, 2),
+        "auto_deferred": auto_deferred,
+        "error": None if error is None else type(error).__name__,
+    }))
+
+
+def prometheus_lines():
+    lines = [
+        "# HELP bot_command_invocations_total Slash command invocations",
+        "# TYPE bot_command_invocations_total counter",
+    ]
+    lines += [f'bot_command_invocations_total{{command="{name}"}} {s.invocations}' for name, s in command_stats.items()]
+    lines += ["# HELP bot_command_errors_total Slash command invocations that raised",
+              "# TYPE bot_command_errors_total counter"]
+    lines += [f'bot_command_errors_total{{command="{name}"}} {s.errors}' for name, s in command_stats.items()]
+    lines += ["# HELP bot_command_auto_defers_total Invocations deferred by the response layer",
+              "# TYPE bot_command_auto_defers_total counter"]
+    lines += [f'bot_command_auto_defers_total{{command="{name}"}} {s.auto_defers}' for name, s in command_stats.items()]
+    lines += ["# HELP bot_command_late_responses_total First responses after the interaction deadline",
+              "# TYPE bot_command_late_responses_total counter"]
+    lines += [f'bot_command_late_responses_total{{command="{name}"}} {s.late_responses}' for name, s in command_stats.items()]
+
+    for metric, attribute, help_text in (
+        ("bot_command_latency_seconds", "latency", "Handler run time"),
+        ("bot_command_first_response_seconds", "first_response", "Interaction creation to first response"),
+        ("bot_command_storage_ops", "storage_ops", "Storage operations per invocation"),
+    ):
+        lines += [f"# HELP {metric} {help_text}", f"# TYPE {metric} histogram"]
+        for name, stats in command_stats.items():
+            lines += getattr(stats, attribute).prometheus(metric, f'command="{name}"')
+
+    lines += ["# HELP bot_storage_operations_total Storage backend calls",
+              "# TYPE bot_storage_operations_total counter"]
+    lines += [f'bot_storage_operations_total{{operation="{op}"}} {count}' for op, (count, _) in storage_stats.items()]
+    lines += ["# HELP bot_storage_seconds_total Time spent in storage backend calls",
+              "# TYPE bot_storage_seconds_total counter"]
+    lines += [f'bot_storage_seconds_total{{operation="{op}"}} {seconds}' for op, (_, seconds) in storage_stats.items()]
+    return lines
@@ -1,15 +1,104 @@
-from flask import Flask
-from threading import Thread
+import math
+import os
+import time
 
-app = Flask('')
+from aiohttp import web
 
-@app.route('/')
-def home():
-    return "<b>Coding Ninjas SRM</b>"
+import instrumentation
 
-def run():
-  app.run(host='0.0.0.0',port=8080)
 
-def keep_alive():
-    t = Thread(target=run)
-    t.start()
\ No newline at end of file
+# Served from the bot's own event loop with aiohttp (already a discord.py dependency),
+# so the health check reflects whether the gateway connection is actually alive.
+HEARTBEAT_STALE_AFTER = float(os.getenv("HEARTBEAT_STALE_AFTER", "90"))
+
+_started_at = time.monotonic()
+
+
+def _gateways(bot):
+    # AutoShardedBot keeps one gateway connection per shard of this process
+    shards = getattr(bot, "shards", None)
+    if shards:
+        return [getattr(shard._parent, "ws", None) for shard in shards.values()]
+    return [getattr(bot, "ws", None)]
+
+
+def heartbeat_age(bot):
+    # Seconds since the gateway last acknowledged a heartbeat (the stalest shard's when
+    # sharded), None when not connected. discord.py doesn't expose this publicly, so
+    # read it off the keep-alive handlers.
+    ages = []
+    for gateway in _gateways(bot):
+        last_ack = getattr(getattr(gateway, "_keep_alive", None), "_last_ack", None)
+        if last_ack is None:
+            return None
+        ages.append(time.perf_counter() - last_ack)
+    return max(ages)
+
+
+def health(bot):
+    latency = bot.latency
+    age = heartbeat_age(bot)
+    healthy = (
+        bot.is_ready()
+        and not bot.is_closed()
+        and math.isfinite(latency)
+        and age is not None
+        and age < HEARTBEAT_STALE_AFTER
+    )
+    return healthy, {
+        "status": "ok" if healthy else "unhealthy",
+        "ready": bot.is_ready(),
+        "latency_seconds": latency if math.isfinite(latency) else None,
+        "heartbeat_age_seconds": age,
+        "guilds": len(bot.guilds),
+        "shards": len(_gateways(bot)),
+        "uptime_seconds": time.monotonic() - _started_at,
+    }
+
+
+def _prometheus(bot):
+    latency = bot.latency
+    age = heartbeat_age(bot)
+    samples = [
+        ("discord_bot_ready", "gauge", "Whether the bot has finished connecting", int(bot.is_ready())),
+        ("discord_gateway_latency_seconds", "gauge", "Latency between a heartbeat and its ack",
+         latency if math.isfinite(latency) else float("nan")),
+        ("discord_heartbeat_age_seconds", "gauge", "Seconds since the last heartbeat ack",
+         age if age is not None else float("nan")),
+        ("discord_guilds", "gauge", "Guilds the bot is a member of", len(bot.guilds)),
+        ("process_uptime_seconds", "counter", "Seconds since the process started", time.monotonic() - _started_at),
+    ]
+    lines = []
+    for name, kind, help_text, value in samples:
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {kind}")
+        lines.append(f"{name} {value}")
+    lines += instrumentation.prometheus_lines()
+    return "\n".join(lines) + "\n"
+
+
+async def home(request):
+    return web.Response(text="<b>Coding Ninjas SRM</b>", content_type="text/html")
+
+
+async def healthz(request):
+    healthy, body = health(request.app["bot"])
+    return web.json_response(body, status=200 if healthy else 503)
+
+
+async def metrics(request):
+    return web.Response(text=_prometheus(request.app["bot"]), content_type="text/plain", charset="utf-8")
+
+
+async def keep_alive(bot, host="0.0.0.0", port=None):
+    app = web.Application()
+    app["bot"] = bot
+    app.router.add_get("/", home)
+    app.router.add_get("/healthz", healthz)
+    app.router.add_get("/metrics", metrics)
+
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, host, port or int(os.getenv("PORT", "8080"))).start()
+    # Caller is responsible for `await runner.cleanup()` on shutdown
+    return runner
@@ -0,0 +1,106 @@
+import asyncio
+import logging
+import math
+import os
+
+import discord
+
+
+log = logging.getLogger("cn_bot.triggers")
+
+# A trigger repeated in the same channel within this many seconds is coalesced: the
+# message is deleted, but the replies still on screen from the first one aren't sent again
+TRIGGER_COOLDOWN = float(os.getenv("TRIGGER_COOLDOWN", "15"))
+# Seconds the bot's replies stay up
+REPLY_LIFETIME = 15
+# Deletions due within the same window are sent together, per channel
+DELETE_BATCH_WINDOW = 1.0
+# Discord's bulk delete takes at most 100 messages
+BULK_DELETE_LIMIT = 100
+# Cooldown entries kept before stale ones are dropped
+MAX_COOLDOWNS = 1024
+
+
+# Delayed message deletions, grouped per channel. Every deletion is rounded up to the end
+# of its DELETE_BATCH_WINDOW and all messages of a channel due in the same window go out
+# as one bulk delete, instead of one timer and one request per message as delete_after
+# does. Channels without bulk delete, or where the bot lacks Manage Messages, fall back
+# to deleting one by one.
+class DeletionBatcher:
+    def __init__(self, window=DELETE_BATCH_WINDOW):
+        self._window = window
+        # (channel ID, window number) -> (channel, messages)
+        self._due = {}
+        self._background = set()
+
+    def schedule(self, message, delay=0.0):
+        loop = asyncio.get_running_loop()
+        slot = math.ceil((loop.time() + delay) / self._window)
+        key = (message.channel.id, slot)
+        if key not in self._due:
+            self._due[key] = (message.channel, [])
+            loop.call_at(slot * self._window, self._flush, key)
+        self._due[key][1].append(message)
+
+    def _flush(self, key):
+        channel, messages = self._due.pop(key)
+        task = asyncio.create_task(self._delete(channel, messages))
+        self._background.add(task)
+        task.add_done_callback(self._background.discard)
+
+    async def _delete(self, channel, messages):
+        for start in range(0, len(messages), BULK_DELETE_LIMIT):
+            chunk = messages[start:start + BULK_DELETE_LIMIT]
+            if len(chunk) > 1 and hasattr(channel, "delete_messages"):
+                try:
+                    await channel.delete_messages(chunk)
+                    continue
+                except discord.HTTPException:
+                    # Missing permission, or a message that is already gone
+                    pass
+            for message in chunk:
+                try:
+                    await message.delete()
+                except discord.NotFound:
+                    pass
+                except discord.HTTPException:
+                    log.warning("Could not delete message %s in channel %s", message.id, channel.id)
+
+
+# Message triggers, looked up by the message's exact (stripped) content in one dict, so
+# ordinary chat costs a single lookup. Each trigger maps to the replies it sends; the
+# trigger message is deleted and the replies are deleted after REPLY_LIFETIME.
+class MessageTriggers:
+    def __init__(self, replies, deletions=None, cooldown=TRIGGER_COOLDOWN):
+        self._replies = {trigger: tuple(texts) for trigger, texts in replies.items()}
+        self._deletions = deletions if deletions is not None else DeletionBatcher()
+        self._cooldown = cooldown
+        # (channel ID, trigger) -> loop time of the last replies
+        self._last = {}
+
+    def _cooling_down(self, key, now):
+        if len(self._last) >= MAX_COOLDOWNS:
+            self._last = {k: at for k, at in self._last.items() if now - at < self._cooldown}
+        if now - self._last.get(key, -math.inf) < self._cooldown:
+            return True
+        self._last[key] = now
+        return False
+
+    async def dispatch(self, message):
+        # Returns whether the message was a trigger
+        trigger = message.content.strip()
+        replies = self._replies.get(trigger)
+        if replies is None:
+            return False
+
+        self._deletions.schedule(message)
+        if self._cooling_down((message.channel.id, trigger), asyncio.get_running_loop().time()):
+            return True
+        for text in replies:
+            try:
+                reply = await message.channel.send(text)
+            except discord.HTTPException:
+                log.warning("Could not reply to %s in channel %s", trigger, message.channel.id)
+                break
+            self._deletions.schedule(reply, REPLY_LIFETIME)
+        return True
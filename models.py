@@ -0,0 +1,115 @@
+# Typed task/receiver/member records, decoded once when they come out of storage and shared
+# from then on (the task cache hands out the same instances, so treat them as read-only).
+#
+# Schema versions:
+#   1 - due_date stored as a Unix timestamp string
+#   2 - due_date stored as an integer, updated_at set on every task write
+SCHEMA_VERSION = 2
+
+
+class Task:
+    __slots__ = (
+        "id", "guild_id", "task_name", "description", "due_date", "assigned_role", "status", "link",
+        "received_count", "completed_count", "counters_synced", "schema_version", "updated_at",
+    )
+
+    def __init__(self, id, task_name, guild_id=None, description=None, due_date=0, assigned_role=None, status="pending",
+                 link=None, received_count=0, completed_count=0, counters_synced=False,
+                 schema_version=SCHEMA_VERSION, updated_at=None):
+        self.id = id
+        self.guild_id = guild_id
+        self.task_name = task_name
+        self.description = description
+        self.due_date = due_date
+        self.assigned_role = assigned_role
+        self.status = status
+        self.link = link
+        self.received_count = received_count
+        self.completed_count = completed_count
+        self.counters_synced = counters_synced
+        self.schema_version = schema_version
+        self.updated_at = updated_at
+
+    @classmethod
+    def from_dict(cls, data):
+        # Version 1 documents are upgraded in memory; task_store persists the upgrade
+        return cls(
+            id=data["id"],
+            task_name=data.get("task_name", "Unnamed Task"),
+            guild_id=data.get("guild_id"),
+            description=data.get("description"),
+            due_date=int(data.get("due_date") or 0),
+            assigned_role=data.get("assigned_role"),
+            status=data.get("status", "pending"),
+            link=data.get("link"),
+            received_count=data.get("received_count") or 0,
+            completed_count=data.get("completed_count") or 0,
+            counters_synced=bool(data.get("counters_synced")),
+            schema_version=data.get("schema_version") or 1,
+            updated_at=data.get("updated_at"),
+        )
+
+    def to_dict(self):
+        return {name: getattr(self, name) for name in self.__slots__ if name != "id"}
+
+    def replace(self, **fields):
+        task = Task.__new__(Task)
+        for name in self.__slots__:
+            setattr(task, name, fields.get(name, getattr(self, name)))
+        return task
+
+    def __repr__(self):
+        return f"<Task id={self.id!r} task_name={self.task_name!r} due_date={self.due_date}>"
+
+
+class Receiver:
+    __slots__ = (
+        "id", "task_id", "user_name", "task_name", "status", "submission_link", "received_at", "submitted_at",
+    )
+
+    def __init__(self, id, task_id=None, user_name=None, task_name=None, status="pending",
+                 submission_link=None, received_at=None, submitted_at=None):
+        self.id = id
+        self.task_id = task_id
+        self.user_name = user_name
+        self.task_name = task_name
+        self.status = status
+        self.submission_link = submission_link
+        self.received_at = received_at
+        self.submitted_at = submitted_at
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(**{name: data.get(name) for name in cls.__slots__ if data.get(name) is not None})
+
+    def replace(self, **fields):
+        receiver = Receiver.__new__(Receiver)
+        for name in self.__slots__:
+            setattr(receiver, name, fields.get(name, getattr(self, name)))
+        return receiver
+
+    def __repr__(self):
+        return f"<Receiver id={self.id!r} task_id={self.task_id!r} status={self.status!r}>"
+
+
+class MemberStats:
+    __slots__ = ("id", "user_name", "received", "completed", "on_time", "late")
+
+    def __init__(self, id, user_name=None, received=0, completed=0, on_time=0, late=0):
+        self.id = id
+        self.user_name = user_name
+        self.received = received
+        self.completed = completed
+        self.on_time = on_time
+        self.late = late
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(**{name: data.get(name) for name in cls.__slots__ if data.get(name) is not None})
+
+    @property
+    def pending(self):
+        return self.received - self.completed
+
+    def __repr__(self):
+        return f"<MemberStats id={self.id!r} received={self.received} completed={self.completed}>"
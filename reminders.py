@@ -0,0 +1,92 @@
+import asyncio
+import heapq
+import logging
+import os
+import time
+
+
+log = logging.getLogger("cn_bot.reminders")
+
+# Seconds before the due date at which the assigned role gets pinged
+REMINDER_OFFSETS = tuple(
+    int(hours) * 3600 for hours in os.getenv("REMINDER_OFFSETS_HOURS", "24,1").split(",") if hours.strip()
+)
+
+
+# Due-date reminders kept in a min-heap of (fire_at, task_id, offset, version). The loop
+# sleeps until the earliest entry or until a task change wakes it. Changing or deleting
+# a task bumps its version instead of searching the heap; entries with an outdated
+# version are skipped when they surface.
+class ReminderScheduler:
+    def __init__(self, send):
+        # send(task, offset) posts the reminder
+        self._send = send
+        self._cache = None
+        self._heap = []
+        self._versions = {}
+        self._wakeup = asyncio.Event()
+        self._runner = None
+
+    def update(self, task_id, task):
+        # Cache listener: (re)schedules a task, or drops it once it no longer needs reminding
+        if task is None or task.status == "completed" or not task.assigned_role:
+            if self._versions.pop(task_id, None) is not None:
+                self._wakeup.set()
+            return
+
+        version = (task.due_date, task.assigned_role)
+        if self._versions.get(task_id) == version:
+            return
+        self._versions[task_id] = version
+
+        now = time.time()
+        for offset in REMINDER_OFFSETS:
+            fire_at = version[0] - offset
+            if fire_at > now:
+                heapq.heappush(self._heap, (fire_at, task_id, offset, version))
+        self._compact()
+        self._wakeup.set()
+
+    def _compact(self):
+        # Rebuild once stale entries clearly outnumber live ones
+        if len(self._heap) > 2 * len(REMINDER_OFFSETS) * max(len(self._versions), 1):
+            self._heap = [entry for entry in self._heap if self._versions.get(entry[1]) == entry[3]]
+            heapq.heapify(self._heap)
+
+    def start(self, cache):
+        # Loads the pending tasks once, then follows the task cache's changes, which cover
+        # both this bot's own writes and those delivered by the storage listener.
+        if self._runner is not None:
+            return
+        self._cache = cache
+        for task in cache.all():
+            self.update(task.id, task)
+        cache.add_listener(self.update)
+        self._runner = asyncio.create_task(self._run())
+
+    async def _run(self):
+        while True:
+            self._wakeup.clear()
+            while self._heap and self._versions.get(self._heap[0][1]) != self._heap[0][3]:
+                heapq.heappop(self._heap)
+
+            if not self._heap:
+                await self._wakeup.wait()
+                continue
+
+            delay = self._heap[0][0] - time.time()
+            if delay > 0:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=delay)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            _, task_id, offset, _ = heapq.heappop(self._heap)
+            task = self._cache.get(task_id)
+            if task is None:
+                continue
+            try:
+                await self._send(task, offset)
+            except Exception:
+                log.exception("Failed to send reminder for task %s", task_id)
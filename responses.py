@@ -0,0 +1,132 @@
+import asyncio
+import os
+
+import discord
+
+
+# Discord drops an interaction that hasn't been acknowledged this many seconds after it
+# was created. If a handler hasn't responded AUTO_DEFER_AFTER seconds in, it is deferred
+# for it and its eventual reply is routed to the followup webhook.
+INTERACTION_DEADLINE = 3.0
+AUTO_DEFER_AFTER = float(os.getenv("AUTO_DEFER_AFTER", "2.0"))
+
+# Keeps pending auto-defer tasks referenced until they finish
+_background = set()
+
+# track() swaps the response by overwriting the slot behind Interaction.response's cached
+# property, a discord.py internal. Fail on import rather than on the first command if a
+# discord.py release renames it.
+if "_cs_response" not in discord.Interaction.__slots__:
+    raise ImportError(
+        f"discord.py {discord.__version__} has no Interaction._cs_response slot; responses.track needs updating"
+    )
+
+
+# Stands in for Interaction.response. Handlers keep calling interaction.response.* as
+# usual; whichever of them or the auto-defer timer acknowledges first wins, and later
+# send_message/edit_message calls go to the followup/original response instead.
+# ephemeral makes the auto-defer's "thinking..." message ephemeral, for commands whose
+# replies are.
+class DeadlineResponse:
+    def __init__(self, interaction, response, on_first_response=None, ephemeral=False):
+        self._interaction = interaction
+        self._response = response
+        self._on_first_response = on_first_response
+        self._ephemeral = ephemeral
+        self._lock = asyncio.Lock()
+        self._timer = None
+        # Set while the public "thinking..." message of an auto-defer awaits its reply
+        self._public_thinking = False
+        self.auto_deferred = False
+
+    def __getattr__(self, name):
+        return getattr(self._response, name)
+
+    def elapsed(self):
+        return (discord.utils.utcnow() - self._interaction.created_at).total_seconds()
+
+    def remaining(self):
+        return INTERACTION_DEADLINE - self.elapsed()
+
+    def arm(self, budget=AUTO_DEFER_AFTER):
+        loop = asyncio.get_running_loop()
+        self._timer = loop.call_later(max(0.0, budget - self.elapsed()), self._spawn_auto_defer)
+
+    def disarm(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+    def _spawn_auto_defer(self):
+        task = asyncio.ensure_future(self._auto_defer())
+        _background.add(task)
+        task.add_done_callback(_background.discard)
+
+    def _responded(self):
+        if self._on_first_response is not None:
+            self._on_first_response()
+
+    async def _auto_defer(self):
+        async with self._lock:
+            if self._response.is_done():
+                return
+            # Slash commands show a "thinking..." state; component interactions get a
+            # silent deferred update of the message they're attached to.
+            thinking = self._interaction.type == discord.InteractionType.application_command
+            try:
+                await self._response.defer(thinking=thinking, ephemeral=self._ephemeral)
+            except discord.HTTPException:
+                return
+            self.auto_deferred = True
+            self._public_thinking = thinking and not self._ephemeral
+            self._responded()
+
+    async def defer(self, **kwargs):
+        async with self._lock:
+            if self._response.is_done():
+                return None
+            self._responded()
+            return await self._response.defer(**kwargs)
+
+    async def send_message(self, content=None, **kwargs):
+        async with self._lock:
+            if not self._response.is_done():
+                self._responded()
+                return await self._response.send_message(content, **kwargs)
+        # Already acknowledged (usually by the auto-defer): the first followup replaces
+        # the "thinking..." message. Followups can't schedule their own deletion.
+        kwargs.pop("delete_after", None)
+        if content is not None:
+            kwargs["content"] = content
+        if self._public_thinking:
+            self._public_thinking = False
+            if kwargs.get("ephemeral"):
+                # Replacing the public "thinking..." message would make the reply public
+                # too; drop it so the reply goes out as a new, ephemeral message
+                try:
+                    await self._interaction.delete_original_response()
+                except discord.HTTPException:
+                    pass
+        return await self._interaction.followup.send(**kwargs)
+
+    async def edit_message(self, **kwargs):
+        async with self._lock:
+            if not self._response.is_done():
+                self._responded()
+                return await self._response.edit_message(**kwargs)
+        kwargs.pop("delete_after", None)
+        return await self._interaction.edit_original_response(**kwargs)
+
+    async def send_modal(self, modal):
+        async with self._lock:
+            self._responded()
+            return await self._response.send_modal(modal)
+
+
+def track(interaction, on_first_response=None, budget=AUTO_DEFER_AFTER, ephemeral=False):
+    # Interaction.response is a cached slot; seeding it routes every
+    # interaction.response call of the handler through the deadline-aware proxy.
+    response = DeadlineResponse(interaction, interaction.response, on_first_response, ephemeral)
+    interaction._cs_response = response
+    response.arm(budget)
+    return response
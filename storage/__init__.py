@@ -0,0 +1,16 @@
+import os
+
+from storage.base import ALREADY_SUBMITTED, NOT_RECEIVED, SUBMITTED, TaskBackend, TaskNotFound, submitted_on_time
+
+
+def create_backend():
+    # STORAGE_BACKEND selects the engine: "firestore" (default) or "sqlite". The engine
+    # modules are imported lazily so a SQLite deployment doesn't need firebase_admin.
+    name = os.getenv("STORAGE_BACKEND", "firestore").lower()
+    if name == "firestore":
+        from storage.firestore_backend import FirestoreBackend
+        return FirestoreBackend(os.getenv("FIREBASE_CREDENTIALS_PATH"))
+    if name == "sqlite":
+        from storage.sqlite_backend import SQLiteBackend
+        return SQLiteBackend(os.getenv("SQLITE_PATH", "cn_bot.db"))
+    raise ValueError(f"Unknown STORAGE_BACKEND: {name}")
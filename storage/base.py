@@ -0,0 +1,151 @@
+# submit_receiver outcomes
+SUBMITTED = "submitted"
+ALREADY_SUBMITTED = "already_submitted"
+NOT_RECEIVED = "not_received"
+
+
+class TaskNotFound(LookupError):
+    # Raised by receiver writes whose task no longer exists (deleted since it was read)
+    pass
+
+
+# due_date is the midnight starting the due day (/create-task takes a plain date), and
+# submissions during that day still count as on time
+DUE_DAY_SECONDS = 24 * 60 * 60
+
+
+def submitted_on_time(submitted_at, due_date):
+    # Whether a submission came in by the end of its task's due day; None when either is
+    # unknown
+    if submitted_at is None or not due_date:
+        return None
+    return float(submitted_at) < float(due_date) + DUE_DAY_SECONDS
+
+
+# Interface every storage engine implements. All methods are blocking; task_store runs
+# them on its thread pool. Tasks and receivers are plain dicts carrying their document
+# ID under "id" (a receiver's ID is the Discord user ID).
+#
+# Tasks live in per-guild collections: every call is scoped to one guild ID (a string)
+# and never reads another guild's tasks, so processes serving different shards don't
+# scan each other's data.
+class TaskBackend:
+    def get_task(self, guild_id, task_id):
+        raise NotImplementedError
+
+    def get_tasks(self, guild_id, task_ids):
+        raise NotImplementedError
+
+    def create_task(self, guild_id, task):
+        # Returns the generated task ID
+        raise NotImplementedError
+
+    def update_task(self, guild_id, task_id, fields):
+        raise NotImplementedError
+
+    def update_tasks(self, guild_id, task_ids, fields):
+        raise NotImplementedError
+
+    def delete_task(self, guild_id, task_id):
+        # Also deletes the task's receivers
+        raise NotImplementedError
+
+    def list_tasks_page(self, guild_id, role_id, status, limit, start_after):
+        # Tasks ordered by (due_date, id), starting after a (due_date, id) cursor
+        raise NotImplementedError
+
+    # The receiver writes below report the task's counters as stored after the write, for
+    # the cache. Engines whose watch_tasks also delivers this process's own writes
+    # (Firestore) report {} and leave the counters to the watch.
+
+    def create_receiver(self, guild_id, task_id, user_id, data):
+        # Atomically creates the receiver and bumps the task's received_count and the
+        # member's received stat; returns the task's counters, or None if the receiver
+        # already existed. Raises TaskNotFound if the task doesn't exist.
+        raise NotImplementedError
+
+    def create_receivers(self, guild_id, user_id, data_by_task):
+        # Bulk create_receiver; returns ({task_id: counters} for the newly received tasks,
+        # the IDs of tasks that don't exist)
+        raise NotImplementedError
+
+    def submit_receiver(self, guild_id, task_id, user_id, fields, on_time):
+        # Atomic check-and-update that also bumps the task's completed_count and the
+        # member's completed stat, plus on_time or late unless on_time is None; returns
+        # (SUBMITTED, ALREADY_SUBMITTED or NOT_RECEIVED, the task's counters). Raises
+        # TaskNotFound if the task doesn't exist.
+        raise NotImplementedError
+
+    def sync_counters(self, guild_id, task_id):
+        # Recounts the task's receivers into its received_count/completed_count fields
+        # and returns them as a dict. Receive/submit keep the counters up to date
+        # afterwards; tasks without counters_synced predate them.
+        raise NotImplementedError
+
+    def list_receivers(self, guild_id, task_id, limit=None, start_after=None):
+        # Receivers ordered by (received_at, id), starting after such a cursor
+        raise NotImplementedError
+
+    def list_submissions(self, guild_id, limit=None):
+        # Completed receivers of every task in the guild (at most limit of them), each
+        # with "task_id" and "task_name"
+        raise NotImplementedError
+
+    def count_submissions(self, guild_id):
+        # Number of completed receivers in the guild, without reading them
+        raise NotImplementedError
+
+    def iter_receivers(self, guild_id, task_id=None, status=None):
+        # Generator over the receivers of one task (or every task in the guild),
+        # optionally only those with the given status, each with "task_id" and
+        # "task_name". Fetches in batches so the full result is never held in memory.
+        raise NotImplementedError
+
+    def watch_tasks(self, guild_id, callback):
+        # Calls callback(changes) with a list of (kind, task_id, data) tuples, kind being
+        # 'ADDED', 'MODIFIED' or 'REMOVED'. The first call carries every task of the
+        # guild; later ones include changes made by other processes. May call back from
+        # another thread; returns a handle with an unsubscribe() method.
+        raise NotImplementedError
+
+    def claim_unscoped_tasks(self, guild_id):
+        # Moves tasks written before tasks were scoped per guild into the guild's
+        # collection. Idempotent; returns the number of tasks moved.
+        raise NotImplementedError
+
+    def close(self):
+        # Stops the engine's background threads and releases its connection; the
+        # backend can't be used afterwards
+        pass
+
+    # Per-member stats: a dict per member of the guild with "id" (the user ID),
+    # "user_name" and the received/completed/on_time/late counts. Kept up to date by the
+    # receive/submit writes above; deleting a task leaves them alone, so members keep
+    # the credit for work they did.
+
+    def get_member_stats(self, guild_id, user_id):
+        raise NotImplementedError
+
+    def top_members(self, guild_id, limit):
+        # Members ordered by completed, then on_time, both descending
+        raise NotImplementedError
+
+    def rebuild_member_stats(self, guild_id):
+        # Backfill: recounts the stats of every member with receivers in the guild from
+        # the receivers themselves. Idempotent; returns the number of members written.
+        # Not safe against concurrent receives/submits; see backfill.py.
+        raise NotImplementedError
+
+    # Guild settings (privileged roles, reminder channel); a flat dict per guild
+
+    def get_guild_config(self, guild_id):
+        raise NotImplementedError
+
+    def update_guild_config(self, guild_id, fields):
+        # Merges fields into the guild's settings; a None value removes the setting
+        raise NotImplementedError
+
+    def watch_guild_config(self, guild_id, callback):
+        # Calls callback(config) with the current settings and again whenever any
+        # process changes them. Same threading and return value as watch_tasks.
+        raise NotImplementedError
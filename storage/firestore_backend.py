@@ -0,0 +1,395 @@
+import firebase_admin
+from firebase_admin import credentials, firestore
+from google.api_core.exceptions import AlreadyExists, NotFound
+
+from storage.base import ALREADY_SUBMITTED, NOT_RECEIVED, SUBMITTED, TaskBackend, TaskNotFound, submitted_on_time
+
+
+# Firestore rejects write batches with more than 500 operations
+BATCH_LIMIT = 500
+
+
+def _to_dict(snapshot):
+    data = snapshot.to_dict()
+    data["id"] = snapshot.id
+    return data
+
+
+class _Batch:
+    # WriteBatch that commits itself whenever it reaches BATCH_LIMIT operations
+    def __init__(self, db):
+        self.db = db
+        self.batch = db.batch()
+        self.pending = 0
+
+    def _added(self):
+        self.pending += 1
+        if self.pending == BATCH_LIMIT:
+            self.commit()
+
+    def set(self, ref, data):
+        self.batch.set(ref, data)
+        self._added()
+
+    def delete(self, ref):
+        self.batch.delete(ref)
+        self._added()
+
+    def commit(self):
+        if self.pending:
+            self.batch.commit()
+        self.batch, self.pending = self.db.batch(), 0
+
+
+# guilds/{guild_id} documents hold the guild's settings and a tasks/{task_id}
+# subcollection, each task with a receivers/{user_id} subcollection. Receivers carry
+# their guild_id so the collection-group submissions query can stay within one guild.
+# A members/{user_id} subcollection holds the per-member stats; the leaderboard query
+# orders it by completed and on_time, which needs a composite index on those fields.
+class FirestoreBackend(TaskBackend):
+    def __init__(self, credentials_path):
+        # A connect attempt that failed further down may already have initialized the
+        # default app; initializing it twice raises, so the retry reuses it
+        try:
+            firebase_admin.get_app()
+        except ValueError:
+            firebase_admin.initialize_app(credentials.Certificate(credentials_path))
+        self.db = firestore.client()
+
+    def _guild_ref(self, guild_id):
+        return self.db.collection('guilds').document(guild_id)
+
+    def _tasks(self, guild_id):
+        return self._guild_ref(guild_id).collection('tasks')
+
+    def _task_ref(self, guild_id, task_id):
+        return self._tasks(guild_id).document(task_id)
+
+    def _receiver_ref(self, guild_id, task_id, user_id):
+        return self._task_ref(guild_id, task_id).collection('receivers').document(str(user_id))
+
+    def _member_ref(self, guild_id, user_id):
+        return self._guild_ref(guild_id).collection('members').document(str(user_id))
+
+    def _received(self, guild_id, user_id, data, count=1):
+        # Every counter is written, if only as Increment(0): the leaderboard query orders
+        # by completed and on_time, and Firestore leaves out documents missing either
+        fields = {
+            'received': firestore.Increment(count),
+            'completed': firestore.Increment(0),
+            'on_time': firestore.Increment(0),
+            'late': firestore.Increment(0),
+        }
+        if data.get('user_name'):
+            fields['user_name'] = data['user_name']
+        return self._member_ref(guild_id, user_id), fields
+
+    def get_task(self, guild_id, task_id):
+        snapshot = self._task_ref(guild_id, task_id).get()
+        return _to_dict(snapshot) if snapshot.exists else None
+
+    def get_tasks(self, guild_id, task_ids):
+        snapshots = self.db.get_all([self._task_ref(guild_id, task_id) for task_id in task_ids])
+        return [_to_dict(snapshot) for snapshot in snapshots if snapshot.exists]
+
+    def create_task(self, guild_id, task):
+        task_ref = self._tasks(guild_id).document()
+        task_ref.set(task)
+        return task_ref.id
+
+    def update_task(self, guild_id, task_id, fields):
+        self._task_ref(guild_id, task_id).update(fields)
+
+    def update_tasks(self, guild_id, task_ids, fields):
+        batch = self.db.batch()
+        for task_id in task_ids:
+            batch.update(self._task_ref(guild_id, task_id), fields)
+        batch.commit()
+
+    def delete_task(self, guild_id, task_id):
+        # Firestore does not cascade deletes; drop the receivers too so they don't linger
+        # in the collection-group submissions query after their task is gone.
+        task_ref = self._task_ref(guild_id, task_id)
+        batch = _Batch(self.db)
+        for receiver in task_ref.collection('receivers').list_documents():
+            batch.delete(receiver)
+        batch.delete(task_ref)
+        batch.commit()
+
+    def list_tasks_page(self, guild_id, role_id, status, limit, start_after):
+        # Ordered by due date with the document ID as tie-breaker so a (due_date, id)
+        # cursor resumes exactly where the previous page stopped.
+        query = self._tasks(guild_id)
+        if role_id is not None:
+            query = query.where('assigned_role', '==', role_id)
+        if status is not None:
+            query = query.where('status', '==', status)
+        query = query.order_by('due_date').order_by('__name__').limit(limit)
+        if start_after is not None:
+            due_date, task_id = start_after
+            query = query.start_after([due_date, self._task_ref(guild_id, task_id)])
+        return [_to_dict(task) for task in query.stream()]
+
+    def create_receiver(self, guild_id, task_id, user_id, data):
+        # create() carries a "must not exist" precondition, so the existence check and
+        # the write are one atomic round trip and two concurrent /receive calls can't both
+        # win. The counter increment rides in the same batch and fails along with it; the
+        # task watch delivers the new count.
+        batch = self.db.batch()
+        batch.create(self._receiver_ref(guild_id, task_id, user_id), {**data, 'guild_id': guild_id})
+        batch.update(self._task_ref(guild_id, task_id), {'received_count': firestore.Increment(1)})
+        batch.set(*self._received(guild_id, user_id, data), merge=True)
+        try:
+            batch.commit()
+        except AlreadyExists:
+            return None
+        except NotFound:
+            # The counter update needs the task document; it was deleted meanwhile
+            raise TaskNotFound(task_id)
+        return {}
+
+    def create_receivers(self, guild_id, user_id, data_by_task):
+        # One get_all to skip tasks that were already received, then one batch of create()s.
+        # If a concurrent /receive slips in between, or one of the tasks is deleted, the
+        # batch is rejected as a whole and the tasks fall back to individual creates.
+        refs = {task_id: self._receiver_ref(guild_id, task_id, user_id) for task_id in data_by_task}
+        existing = {
+            snapshot.reference.parent.parent.id
+            for snapshot in self.db.get_all(list(refs.values()))
+            if snapshot.exists
+        }
+        created = [task_id for task_id in refs if task_id not in existing]
+        if not created:
+            return {}, []
+
+        batch = self.db.batch()
+        for task_id in created:
+            batch.create(refs[task_id], {**data_by_task[task_id], 'guild_id': guild_id})
+            batch.update(self._task_ref(guild_id, task_id), {'received_count': firestore.Increment(1)})
+        batch.set(*self._received(guild_id, user_id, data_by_task[created[0]], len(created)), merge=True)
+        try:
+            batch.commit()
+        except (AlreadyExists, NotFound):
+            return self._create_receivers_one_by_one(guild_id, user_id, {task_id: data_by_task[task_id] for task_id in created})
+        return {task_id: {} for task_id in created}, []
+
+    def _create_receivers_one_by_one(self, guild_id, user_id, data_by_task):
+        created, missing = {}, []
+        for task_id, data in data_by_task.items():
+            try:
+                counters = self.create_receiver(guild_id, task_id, user_id, data)
+            except TaskNotFound:
+                missing.append(task_id)
+                continue
+            if counters is not None:
+                created[task_id] = counters
+        return created, missing
+
+    def submit_receiver(self, guild_id, task_id, user_id, fields, on_time):
+        receiver_ref = self._receiver_ref(guild_id, task_id, user_id)
+        member = {
+            'completed': firestore.Increment(1),
+            'on_time': firestore.Increment(1 if on_time is True else 0),
+            'late': firestore.Increment(1 if on_time is False else 0),
+        }
+
+        @firestore.transactional
+        def submit(transaction):
+            receiver = receiver_ref.get(transaction=transaction)
+            if not receiver.exists:
+                return NOT_RECEIVED
+            if receiver.get('status') == 'completed':
+                return ALREADY_SUBMITTED
+            transaction.update(receiver_ref, fields)
+            transaction.update(self._task_ref(guild_id, task_id), {'completed_count': firestore.Increment(1)})
+            transaction.set(self._member_ref(guild_id, user_id), member, merge=True)
+            return SUBMITTED
+
+        try:
+            return submit(self.db.transaction()), {}
+        except NotFound:
+            raise TaskNotFound(task_id)
+
+    def sync_counters(self, guild_id, task_id):
+        # The transaction's read locks the task document, so receive/submit increments
+        # wait until the recounted values are written instead of being overwritten.
+        task_ref = self._task_ref(guild_id, task_id)
+        receivers = task_ref.collection('receivers')
+
+        @firestore.transactional
+        def sync(transaction):
+            task_ref.get(transaction=transaction)
+            counters = {
+                'received_count': receivers.count().get()[0][0].value,
+                'completed_count': receivers.where('status', '==', 'completed').count().get()[0][0].value,
+            }
+            transaction.update(task_ref, {**counters, 'counters_synced': True})
+            return counters
+
+        return sync(self.db.transaction())
+
+    def list_receivers(self, guild_id, task_id, limit=None, start_after=None):
+        query = self._task_ref(guild_id, task_id).collection('receivers').order_by('received_at').order_by('__name__')
+        if start_after is not None:
+            received_at, user_id = start_after
+            query = query.start_after([received_at, self._receiver_ref(guild_id, task_id, user_id)])
+        if limit is not None:
+            query = query.limit(limit)
+        return [_to_dict(receiver) for receiver in query.stream()]
+
+    def list_submissions(self, guild_id, limit=None):
+        # A single collection-group query over the guild's receivers. The task name is
+        # denormalized onto the receiver when it is received/submitted, so only documents
+        # written before that need their parent task looked up (in one batched get_all).
+        submissions = []
+        legacy_parents = {}
+        completed = (
+            self.db.collection_group('receivers')
+            .where('guild_id', '==', guild_id)
+            .where('status', '==', 'completed')
+        )
+        if limit is not None:
+            completed = completed.limit(limit)
+        for submission in completed.stream():
+            data = _to_dict(submission)
+            task_ref = submission.reference.parent.parent
+            data["task_id"] = task_ref.id
+            if "task_name" not in data:
+                legacy_parents[task_ref.id] = task_ref
+            submissions.append(data)
+
+        if legacy_parents:
+            task_names = {
+                task.id: task.to_dict().get("task_name", "N/A")
+                for task in self.db.get_all(list(legacy_parents.values()))
+                if task.exists
+            }
+            # Orphaned receivers of already deleted tasks are dropped, as before
+            submissions = [
+                data for data in submissions
+                if "task_name" in data or data["task_id"] in task_names
+            ]
+            for data in submissions:
+                data.setdefault("task_name", task_names.get(data["task_id"]))
+        return submissions
+
+    def count_submissions(self, guild_id):
+        # A count() aggregation is billed per batch of index entries, not per document
+        completed = (
+            self.db.collection_group('receivers')
+            .where('guild_id', '==', guild_id)
+            .where('status', '==', 'completed')
+        )
+        return completed.count().get()[0][0].value
+
+    def iter_receivers(self, guild_id, task_id=None, status=None):
+        # stream() pulls documents from the server as the generator is consumed
+        if task_id is not None:
+            query = self._task_ref(guild_id, task_id).collection('receivers')
+        else:
+            query = self.db.collection_group('receivers').where('guild_id', '==', guild_id)
+        if status is not None:
+            query = query.where('status', '==', status)
+
+        # Only receivers written before the task name was denormalized need a lookup;
+        # remembered per task, and receivers of deleted tasks are skipped
+        task_names = {}
+        for receiver in query.stream():
+            data = _to_dict(receiver)
+            task_ref = receiver.reference.parent.parent
+            data["task_id"] = task_ref.id
+            if "task_name" not in data:
+                if task_ref.id not in task_names:
+                    task = task_ref.get()
+                    task_names[task_ref.id] = task.to_dict().get("task_name", "N/A") if task.exists else None
+                if task_names[task_ref.id] is None:
+                    continue
+                data["task_name"] = task_names[task_ref.id]
+            yield data
+
+    def watch_tasks(self, guild_id, callback):
+        # The listener's first snapshot carries the whole collection, so it doubles as the
+        # warm-up read; afterwards only changed documents are delivered, whichever
+        # process wrote them.
+        def on_snapshot(snapshots, changes, read_time):
+            callback([(change.type.name, change.document.id, change.document.to_dict()) for change in changes])
+
+        return self._tasks(guild_id).on_snapshot(on_snapshot)
+
+    def get_member_stats(self, guild_id, user_id):
+        snapshot = self._member_ref(guild_id, user_id).get()
+        return _to_dict(snapshot) if snapshot.exists else None
+
+    def top_members(self, guild_id, limit):
+        query = (
+            self._guild_ref(guild_id).collection('members')
+            .order_by('completed', direction=firestore.Query.DESCENDING)
+            .order_by('on_time', direction=firestore.Query.DESCENDING)
+            .limit(limit)
+        )
+        return [_to_dict(member) for member in query.stream()]
+
+    def rebuild_member_stats(self, guild_id):
+        # Streams the guild's receivers once and overwrites the members' stats with the
+        # totals. A receive/submit landing between the read and the write would be lost,
+        # so this only runs from backfill.py, with the bot stopped.
+        due_dates = {task.id: task.to_dict().get('due_date') for task in self._tasks(guild_id).stream()}
+        members = {}
+        receivers = self.db.collection_group('receivers').where('guild_id', '==', guild_id)
+        for receiver in receivers.stream():
+            task_id = receiver.reference.parent.parent.id
+            if task_id not in due_dates:
+                continue
+            data = receiver.to_dict()
+            stats = members.setdefault(receiver.id, {'received': 0, 'completed': 0, 'on_time': 0, 'late': 0})
+            if data.get('user_name'):
+                stats['user_name'] = data['user_name']
+            stats['received'] += 1
+            if data.get('status') == 'completed':
+                stats['completed'] += 1
+                on_time = submitted_on_time(data.get('submitted_at'), due_dates[task_id])
+                if on_time is not None:
+                    stats['on_time' if on_time else 'late'] += 1
+
+        batch = _Batch(self.db)
+        for user_id, stats in members.items():
+            batch.set(self._member_ref(guild_id, user_id), stats)
+        batch.commit()
+        return len(members)
+
+    def claim_unscoped_tasks(self, guild_id):
+        # Copies the top-level tasks collection (and each task's receivers) under the
+        # guild, then deletes the originals. Copies are plain set()s, so a run that was
+        # interrupted halfway can simply be repeated.
+        moved = 0
+        batch = _Batch(self.db)
+        for task in self.db.collection('tasks').stream():
+            receivers = list(task.reference.collection('receivers').stream())
+            batch.set(self._task_ref(guild_id, task.id), {**task.to_dict(), 'guild_id': guild_id})
+            for receiver in receivers:
+                batch.set(
+                    self._receiver_ref(guild_id, task.id, receiver.id),
+                    {**receiver.to_dict(), 'guild_id': guild_id}
+                )
+            batch.commit()
+            for receiver in receivers:
+                batch.delete(receiver.reference)
+            batch.delete(task.reference)
+            batch.commit()
+            moved += 1
+        return moved
+
+    def get_guild_config(self, guild_id):
+        snapshot = self._guild_ref(guild_id).get()
+        return snapshot.to_dict() if snapshot.exists else {}
+
+    def update_guild_config(self, guild_id, fields):
+        fields = {key: firestore.DELETE_FIELD if value is None else value for key, value in fields.items()}
+        self._guild_ref(guild_id).set(fields, merge=True)
+
+    def watch_guild_config(self, guild_id, callback):
+        def on_snapshot(snapshots, changes, read_time):
+            snapshot = snapshots[0] if snapshots else None
+            callback(snapshot.to_dict() if snapshot is not None and snapshot.exists else {})
+
+        return self._guild_ref(guild_id).on_snapshot(on_snapshot)
@@ -0,0 +1,524 @@
+import json
+import logging
+import os
+import sqlite3
+import threading
+import uuid
+
+from storage.base import ALREADY_SUBMITTED, DUE_DAY_SECONDS, NOT_RECEIVED, SUBMITTED, TaskBackend, TaskNotFound
+
+
+log = logging.getLogger("cn_bot.storage")
+
+# Seconds between checks for writes made by other processes sharing the database file
+WATCH_INTERVAL = float(os.getenv("SQLITE_WATCH_INTERVAL", "2"))
+
+# Rows per query when streaming receivers
+EXPORT_BATCH = 500
+
+# Schema migrations, applied in order and tracked with PRAGMA user_version
+MIGRATIONS = [
+    """
+    CREATE TABLE tasks (
+        id TEXT PRIMARY KEY,
+        task_name TEXT NOT NULL,
+        description TEXT,
+        due_date TEXT,
+        assigned_role TEXT,
+        status TEXT,
+        link TEXT
+    );
+    CREATE INDEX tasks_assigned_role ON tasks (assigned_role, due_date, id);
+    CREATE INDEX tasks_status ON tasks (status, due_date, id);
+    CREATE INDEX tasks_due_date ON tasks (due_date, id);
+
+    CREATE TABLE receivers (
+        task_id TEXT NOT NULL,
+        user_id TEXT NOT NULL,
+        user_name TEXT,
+        task_name TEXT,
+        status TEXT,
+        submission_link TEXT,
+        received_at REAL,
+        submitted_at REAL,
+        PRIMARY KEY (task_id, user_id)
+    );
+    CREATE INDEX receivers_task_status ON receivers (task_id, status);
+    CREATE INDEX receivers_status ON receivers (status);
+    """,
+    """
+    ALTER TABLE tasks ADD COLUMN received_count INTEGER NOT NULL DEFAULT 0;
+    ALTER TABLE tasks ADD COLUMN completed_count INTEGER NOT NULL DEFAULT 0;
+    -- Counters are maintained in the same transaction as every receiver write, so
+    -- SQLite tasks are always in sync
+    ALTER TABLE tasks ADD COLUMN counters_synced INTEGER NOT NULL DEFAULT 1;
+    UPDATE tasks SET
+        received_count = (SELECT COUNT(*) FROM receivers WHERE task_id = tasks.id),
+        completed_count = (SELECT COUNT(*) FROM receivers WHERE task_id = tasks.id AND status = 'completed');
+    CREATE INDEX receivers_task_received ON receivers (task_id, received_at, user_id);
+    """,
+    """
+    -- Schema version 2: due dates become integers (they were stored as timestamp
+    -- strings, which also sorted wrongly once lengths differed)
+    CREATE TABLE tasks_v2 (
+        id TEXT PRIMARY KEY,
+        task_name TEXT NOT NULL,
+        description TEXT,
+        due_date INTEGER,
+        assigned_role TEXT,
+        status TEXT,
+        link TEXT,
+        received_count INTEGER NOT NULL DEFAULT 0,
+        completed_count INTEGER NOT NULL DEFAULT 0,
+        counters_synced INTEGER NOT NULL DEFAULT 1,
+        schema_version INTEGER NOT NULL DEFAULT 2,
+        updated_at REAL
+    );
+    INSERT INTO tasks_v2 (id, task_name, description, due_date, assigned_role, status, link,
+                          received_count, completed_count, counters_synced)
+        SELECT id, task_name, description, CAST(due_date AS INTEGER), assigned_role, status, link,
+               received_count, completed_count, counters_synced
+        FROM tasks;
+    DROP TABLE tasks;
+    ALTER TABLE tasks_v2 RENAME TO tasks;
+    CREATE INDEX tasks_assigned_role ON tasks (assigned_role, due_date, id);
+    CREATE INDEX tasks_status ON tasks (status, due_date, id);
+    CREATE INDEX tasks_due_date ON tasks (due_date, id);
+    """,
+    """
+    -- Per-guild scoping. Existing rows keep a NULL guild_id until claim_unscoped_tasks
+    -- assigns them to the guild the bot used to run in.
+    ALTER TABLE tasks ADD COLUMN guild_id TEXT;
+    ALTER TABLE receivers ADD COLUMN guild_id TEXT;
+    CREATE INDEX tasks_guild ON tasks (guild_id, due_date, id);
+    CREATE INDEX tasks_guild_status ON tasks (guild_id, status, due_date, id);
+    CREATE INDEX receivers_guild_status ON receivers (guild_id, status);
+
+    CREATE TABLE guild_config (
+        guild_id TEXT PRIMARY KEY,
+        config TEXT NOT NULL
+    );
+    """,
+    """
+    -- Per-member stats, updated in the same transaction as the receiver writes and
+    -- backfilled per guild by rebuild_member_stats
+    CREATE TABLE members (
+        guild_id TEXT NOT NULL,
+        user_id TEXT NOT NULL,
+        user_name TEXT,
+        received INTEGER NOT NULL DEFAULT 0,
+        completed INTEGER NOT NULL DEFAULT 0,
+        on_time INTEGER NOT NULL DEFAULT 0,
+        late INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (guild_id, user_id)
+    );
+    CREATE INDEX members_leaderboard ON members (guild_id, completed DESC, on_time DESC, user_id);
+    """,
+]
+
+TASK_FIELDS = (
+    "task_name", "description", "due_date", "assigned_role", "status", "link",
+    "received_count", "completed_count", "counters_synced", "schema_version", "updated_at", "guild_id",
+)
+RECEIVER_FIELDS = ("guild_id", "user_name", "task_name", "status", "submission_link", "received_at", "submitted_at")
+
+
+def _task(row):
+    return dict(row)
+
+
+def _receiver(row):
+    # Firestore receivers only carry the fields that were written; mirror that by
+    # leaving out NULL columns so both backends decode to the same Receiver.
+    data = {key: row[key] for key in row.keys() if row[key] is not None}
+    data["id"] = data.pop("user_id")
+    return data
+
+
+def _member(row):
+    data = dict(row)
+    data["id"] = data.pop("user_id")
+    del data["guild_id"]
+    return data
+
+
+def _columns(fields, allowed):
+    unknown = set(fields) - set(allowed)
+    if unknown:
+        raise ValueError(f"Unknown fields: {', '.join(sorted(unknown))}")
+    return list(fields)
+
+
+class _Watch:
+    def __init__(self, backend, refresh):
+        self._backend = backend
+        self.refresh = refresh
+
+    def unsubscribe(self):
+        with self._backend._lock:
+            self._backend._watches.discard(self)
+
+
+# Local single-file engine. One connection is shared by the store's worker threads and
+# serialized with a lock; WAL keeps commits cheap and lets external readers (backups,
+# ad-hoc queries) and other bot processes (one per shard group) use the same file.
+class SQLiteBackend(TaskBackend):
+    def __init__(self, path):
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._migrate()
+        self._watches = set()
+        self._poller = None
+        self._closed = threading.Event()
+        self._data_version = self._conn.execute("PRAGMA data_version").fetchone()[0]
+
+    def _migrate(self):
+        with self._lock:
+            version = self._conn.execute("PRAGMA user_version").fetchone()[0]
+            for number, script in enumerate(MIGRATIONS[version:], start=version + 1):
+                self._conn.executescript(f"BEGIN; {script} PRAGMA user_version = {number}; COMMIT;")
+
+    def _query(self, sql, params=()):
+        with self._lock:
+            return self._conn.execute(sql, params).fetchall()
+
+    def get_task(self, guild_id, task_id):
+        rows = self._query("SELECT * FROM tasks WHERE guild_id = ? AND id = ?", (guild_id, task_id))
+        return _task(rows[0]) if rows else None
+
+    def get_tasks(self, guild_id, task_ids):
+        placeholders = ", ".join("?" * len(task_ids))
+        rows = self._query(f"SELECT * FROM tasks WHERE guild_id = ? AND id IN ({placeholders})", [guild_id, *task_ids])
+        return [_task(row) for row in rows]
+
+    def create_task(self, guild_id, task):
+        task_id = uuid.uuid4().hex[:20]
+        task = {**task, "guild_id": guild_id}
+        columns = _columns(task, TASK_FIELDS)
+        with self._lock, self._conn:
+            self._conn.execute(
+                f"INSERT INTO tasks (id, {', '.join(columns)}) VALUES (?{', ?' * len(columns)})",
+                [task_id] + [task[column] for column in columns]
+            )
+        return task_id
+
+    def update_task(self, guild_id, task_id, fields):
+        self.update_tasks(guild_id, [task_id], fields)
+
+    def update_tasks(self, guild_id, task_ids, fields):
+        columns = _columns(fields, TASK_FIELDS)
+        assignments = ", ".join(f"{column} = ?" for column in columns)
+        values = [fields[column] for column in columns]
+        with self._lock, self._conn:
+            self._conn.executemany(
+                f"UPDATE tasks SET {assignments} WHERE guild_id = ? AND id = ?",
+                [values + [guild_id, task_id] for task_id in task_ids]
+            )
+
+    def delete_task(self, guild_id, task_id):
+        with self._lock, self._conn:
+            cursor = self._conn.execute("DELETE FROM tasks WHERE guild_id = ? AND id = ?", (guild_id, task_id))
+            if cursor.rowcount:
+                self._conn.execute("DELETE FROM receivers WHERE task_id = ?", (task_id,))
+
+    def list_tasks_page(self, guild_id, role_id, status, limit, start_after):
+        clauses, params = ["guild_id = ?"], [guild_id]
+        if role_id is not None:
+            clauses.append("assigned_role = ?")
+            params.append(role_id)
+        if status is not None:
+            clauses.append("status = ?")
+            params.append(status)
+        if start_after is not None:
+            clauses.append("(due_date, id) > (?, ?)")
+            params.extend(start_after)
+        rows = self._query(
+            f"SELECT * FROM tasks WHERE {' AND '.join(clauses)} ORDER BY due_date, id LIMIT ?", params + [limit]
+        )
+        return [_task(row) for row in rows]
+
+    def _insert_receiver(self, guild_id, task_id, user_id, data):
+        data = {**data, "guild_id": guild_id}
+        columns = _columns(data, RECEIVER_FIELDS)
+        # Only for tasks that still exist, like the Firestore counter update
+        cursor = self._conn.execute(
+            f"INSERT OR IGNORE INTO receivers (task_id, user_id, {', '.join(columns)}) "
+            f"SELECT ?, ?{', ?' * len(columns)} "
+            "WHERE EXISTS (SELECT 1 FROM tasks WHERE guild_id = ? AND id = ?)",
+            [task_id, str(user_id)] + [data[column] for column in columns] + [guild_id, task_id]
+        )
+        if cursor.rowcount != 1:
+            if not self._task_exists(guild_id, task_id):
+                raise TaskNotFound(task_id)
+            return None
+        self._conn.execute("UPDATE tasks SET received_count = received_count + 1 WHERE id = ?", (task_id,))
+        self._conn.execute(
+            "INSERT INTO members (guild_id, user_id, user_name, received) VALUES (?, ?, ?, 1) "
+            "ON CONFLICT (guild_id, user_id) DO UPDATE SET "
+            "received = received + 1, user_name = COALESCE(excluded.user_name, user_name)",
+            (guild_id, str(user_id), data.get("user_name"))
+        )
+        return self._counters(task_id)
+
+    def _task_exists(self, guild_id, task_id):
+        return self._conn.execute(
+            "SELECT 1 FROM tasks WHERE guild_id = ? AND id = ?", (guild_id, task_id)
+        ).fetchone() is not None
+
+    def _counters(self, task_id):
+        # Read in the writing transaction, so they include exactly the writes so far
+        row = self._conn.execute(
+            "SELECT received_count, completed_count FROM tasks WHERE id = ?", (task_id,)
+        ).fetchone()
+        return dict(row) if row else {}
+
+    def create_receiver(self, guild_id, task_id, user_id, data):
+        with self._lock, self._conn:
+            return self._insert_receiver(guild_id, task_id, user_id, data)
+
+    def create_receivers(self, guild_id, user_id, data_by_task):
+        created, missing = {}, []
+        with self._lock, self._conn:
+            for task_id, data in data_by_task.items():
+                try:
+                    counters = self._insert_receiver(guild_id, task_id, user_id, data)
+                except TaskNotFound:
+                    missing.append(task_id)
+                    continue
+                if counters is not None:
+                    created[task_id] = counters
+        return created, missing
+
+    def submit_receiver(self, guild_id, task_id, user_id, fields, on_time):
+        columns = _columns(fields, RECEIVER_FIELDS)
+        assignments = ", ".join(f"{column} = ?" for column in columns)
+        with self._lock, self._conn:
+            cursor = self._conn.execute(
+                f"UPDATE receivers SET {assignments} "
+                "WHERE guild_id = ? AND task_id = ? AND user_id = ? AND status IS NOT 'completed'",
+                [fields[column] for column in columns] + [guild_id, task_id, str(user_id)]
+            )
+            if cursor.rowcount == 1:
+                self._conn.execute("UPDATE tasks SET completed_count = completed_count + 1 WHERE id = ?", (task_id,))
+                self._conn.execute(
+                    "INSERT INTO members (guild_id, user_id, completed, on_time, late) VALUES (?, ?, 1, ?, ?) "
+                    "ON CONFLICT (guild_id, user_id) DO UPDATE SET "
+                    "completed = completed + 1, on_time = on_time + excluded.on_time, late = late + excluded.late",
+                    (guild_id, str(user_id), int(on_time is True), int(on_time is False))
+                )
+                return SUBMITTED, self._counters(task_id)
+            if not self._task_exists(guild_id, task_id):
+                raise TaskNotFound(task_id)
+            exists = self._conn.execute(
+                "SELECT 1 FROM receivers WHERE guild_id = ? AND task_id = ? AND user_id = ?",
+                (guild_id, task_id, str(user_id))
+            ).fetchone()
+            return (ALREADY_SUBMITTED if exists else NOT_RECEIVED), {}
+
+    def sync_counters(self, guild_id, task_id):
+        with self._lock, self._conn:
+            self._conn.execute(
+                "UPDATE tasks SET "
+                "received_count = (SELECT COUNT(*) FROM receivers WHERE task_id = tasks.id), "
+                "completed_count = (SELECT COUNT(*) FROM receivers WHERE task_id = tasks.id AND status = 'completed'), "
+                "counters_synced = 1 "
+                "WHERE guild_id = ? AND id = ?",
+                (guild_id, task_id)
+            )
+            row = self._conn.execute(
+                "SELECT received_count, completed_count FROM tasks WHERE guild_id = ? AND id = ?", (guild_id, task_id)
+            ).fetchone()
+        return dict(row) if row else {"received_count": 0, "completed_count": 0}
+
+    def list_receivers(self, guild_id, task_id, limit=None, start_after=None):
+        sql, params = "SELECT * FROM receivers WHERE guild_id = ? AND task_id = ?", [guild_id, task_id]
+        if start_after is not None:
+            sql += " AND (received_at, user_id) > (?, ?)"
+            params.extend(start_after)
+        sql += " ORDER BY received_at, user_id"
+        if limit is not None:
+            sql += " LIMIT ?"
+            params.append(limit)
+        return [_receiver(row) for row in self._query(sql, params)]
+
+    def list_submissions(self, guild_id, limit=None):
+        sql = (
+            "SELECT receivers.task_id, receivers.user_id, receivers.user_name, receivers.status, "
+            "receivers.submission_link, receivers.received_at, receivers.submitted_at, tasks.task_name "
+            "FROM receivers "
+            "JOIN tasks ON tasks.id = receivers.task_id "
+            "WHERE receivers.guild_id = ? AND receivers.status = 'completed'"
+        )
+        params = [guild_id]
+        if limit is not None:
+            sql += " LIMIT ?"
+            params.append(limit)
+        return [_receiver(row) for row in self._query(sql, params)]
+
+    def count_submissions(self, guild_id):
+        rows = self._query(
+            "SELECT COUNT(*) FROM receivers "
+            "JOIN tasks ON tasks.id = receivers.task_id "
+            "WHERE receivers.guild_id = ? AND receivers.status = 'completed'",
+            (guild_id,)
+        )
+        return rows[0][0]
+
+    def iter_receivers(self, guild_id, task_id=None, status=None):
+        # Keyset-paginated on the primary key; the lock is only held per batch, so a
+        # long export doesn't stall the bot's other queries
+        clauses, params = ["receivers.guild_id = ?"], [guild_id]
+        if task_id is not None:
+            clauses.append("receivers.task_id = ?")
+            params.append(task_id)
+        if status is not None:
+            clauses.append("receivers.status = ?")
+            params.append(status)
+        sql = (
+            "SELECT receivers.task_id, receivers.user_id, receivers.user_name, receivers.status, "
+            "receivers.submission_link, receivers.received_at, receivers.submitted_at, tasks.task_name "
+            "FROM receivers "
+            "JOIN tasks ON tasks.id = receivers.task_id "
+            f"WHERE {' AND '.join(clauses)} AND (receivers.task_id, receivers.user_id) > (?, ?) "
+            "ORDER BY receivers.task_id, receivers.user_id LIMIT ?"
+        )
+        cursor = ("", "")
+        while True:
+            rows = self._query(sql, params + list(cursor) + [EXPORT_BATCH])
+            for row in rows:
+                yield _receiver(row)
+            if len(rows) < EXPORT_BATCH:
+                return
+            cursor = (rows[-1]["task_id"], rows[-1]["user_id"])
+
+    def get_member_stats(self, guild_id, user_id):
+        rows = self._query("SELECT * FROM members WHERE guild_id = ? AND user_id = ?", (guild_id, str(user_id)))
+        return _member(rows[0]) if rows else None
+
+    def top_members(self, guild_id, limit):
+        rows = self._query(
+            "SELECT * FROM members WHERE guild_id = ? ORDER BY completed DESC, on_time DESC, user_id LIMIT ?",
+            (guild_id, limit)
+        )
+        return [_member(row) for row in rows]
+
+    def rebuild_member_stats(self, guild_id):
+        # One statement in one transaction, so receives/submits can't interleave with it.
+        # On time means by the end of the due day, as in submitted_on_time.
+        with self._lock, self._conn:
+            return self._conn.execute(
+                "INSERT INTO members (guild_id, user_id, user_name, received, completed, on_time, late) "
+                "SELECT receivers.guild_id, receivers.user_id, MAX(receivers.user_name), COUNT(*), "
+                "COUNT(CASE WHEN receivers.status = 'completed' THEN 1 END), "
+                "COUNT(CASE WHEN receivers.status = 'completed' AND tasks.due_date "
+                "AND receivers.submitted_at < tasks.due_date + ? THEN 1 END), "
+                "COUNT(CASE WHEN receivers.status = 'completed' AND tasks.due_date "
+                "AND receivers.submitted_at >= tasks.due_date + ? THEN 1 END) "
+                "FROM receivers "
+                "JOIN tasks ON tasks.id = receivers.task_id "
+                "WHERE receivers.guild_id = ? "
+                "GROUP BY receivers.guild_id, receivers.user_id "
+                "ON CONFLICT (guild_id, user_id) DO UPDATE SET "
+                "user_name = COALESCE(excluded.user_name, user_name), received = excluded.received, "
+                "completed = excluded.completed, on_time = excluded.on_time, late = excluded.late",
+                (DUE_DAY_SECONDS, DUE_DAY_SECONDS, guild_id)
+            ).rowcount
+
+    def claim_unscoped_tasks(self, guild_id):
+        with self._lock, self._conn:
+            moved = self._conn.execute("UPDATE tasks SET guild_id = ? WHERE guild_id IS NULL", (guild_id,)).rowcount
+            self._conn.execute(
+                "UPDATE receivers SET guild_id = (SELECT guild_id FROM tasks WHERE tasks.id = receivers.task_id) "
+                "WHERE guild_id IS NULL"
+            )
+        return moved
+
+    def get_guild_config(self, guild_id):
+        rows = self._query("SELECT config FROM guild_config WHERE guild_id = ?", (guild_id,))
+        return json.loads(rows[0]["config"]) if rows else {}
+
+    def update_guild_config(self, guild_id, fields):
+        with self._lock, self._conn:
+            row = self._conn.execute("SELECT config FROM guild_config WHERE guild_id = ?", (guild_id,)).fetchone()
+            config = json.loads(row["config"]) if row else {}
+            for key, value in fields.items():
+                if value is None:
+                    config.pop(key, None)
+                else:
+                    config[key] = value
+            self._conn.execute(
+                "INSERT INTO guild_config (guild_id, config) VALUES (?, ?) "
+                "ON CONFLICT (guild_id) DO UPDATE SET config = excluded.config",
+                (guild_id, json.dumps(config))
+            )
+
+    # Watches. Writes from this process already reach the cache through the store's
+    # write-through, so the watches only have to pick up other processes' writes: a
+    # poller thread checks PRAGMA data_version (which only moves when another connection
+    # commits) and re-reads the watched guilds when it changed.
+
+    def _watch(self, refresh):
+        refresh(initial=True)
+        watch = _Watch(self, refresh)
+        with self._lock:
+            self._watches.add(watch)
+            if self._poller is None:
+                self._poller = threading.Thread(target=self._poll, name="sqlite-watch", daemon=True)
+                self._poller.start()
+        return watch
+
+    def _poll(self):
+        while not self._closed.wait(WATCH_INTERVAL):
+            with self._lock:
+                data_version = self._conn.execute("PRAGMA data_version").fetchone()[0]
+                if data_version == self._data_version:
+                    continue
+                self._data_version = data_version
+                watches = list(self._watches)
+            for watch in watches:
+                try:
+                    watch.refresh()
+                except Exception:
+                    log.exception("Failed to refresh a watch")
+
+    def close(self):
+        self._closed.set()
+        if self._poller is not None:
+            self._poller.join()
+        with self._lock:
+            self._watches.clear()
+            self._conn.close()
+
+    def watch_tasks(self, guild_id, callback):
+        known = {}
+
+        def refresh(initial=False):
+            rows = self._query("SELECT * FROM tasks WHERE guild_id = ?", (guild_id,))
+            current = {row["id"]: _task(row) for row in rows}
+            changes = [('REMOVED', task_id, task) for task_id, task in known.items() if task_id not in current]
+            for task_id, task in current.items():
+                if task_id not in known:
+                    changes.append(('ADDED', task_id, task))
+                elif known[task_id] != task:
+                    changes.append(('MODIFIED', task_id, task))
+            known.clear()
+            known.update(current)
+            if changes or initial:
+                callback(changes)
+
+        return self._watch(refresh)
+
+    def watch_guild_config(self, guild_id, callback):
+        known = None
+
+        def refresh(initial=False):
+            nonlocal known
+            config = self.get_guild_config(guild_id)
+            if config != known or initial:
+                known = config
+                callback(config)
+
+        return self._watch(refresh)
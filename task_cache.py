@@ -0,0 +1,114 @@
+from collections import OrderedDict, defaultdict
+
+
+# In-memory copy of the task collections of the guilds this process serves, holding
+# models.Task/Receiver instances. It is only touched from the event loop: the store
+# writes through to it after its own mutations and the storage listeners hand their
+# changes over with call_soon_threadsafe. Tasks are replaced rather than mutated
+# (counters aside), so callers can share them.
+class TaskCache:
+    def __init__(self, max_receivers=5000):
+        # Guilds whose listener has delivered its first snapshot
+        self._ready = set()
+        self._tasks = {}
+        self._by_guild = defaultdict(set)
+        self._by_role = defaultdict(set)
+        # (task_id, user_id) -> receiver, least recently used first
+        self._receivers = OrderedDict()
+        self._max_receivers = max_receivers
+        # Called as listener(task_id, task) after every change, task being None on removal
+        self._listeners = []
+
+    def __len__(self):
+        return len(self._tasks)
+
+    def __contains__(self, task_id):
+        return task_id in self._tasks
+
+    def add_listener(self, listener):
+        self._listeners.append(listener)
+
+    def _notify(self, task_id, task):
+        for listener in self._listeners:
+            listener(task_id, task)
+
+    def is_ready(self, guild_id):
+        return guild_id in self._ready
+
+    def mark_ready(self, guild_id):
+        self._ready.add(guild_id)
+
+    def drop_guild(self, guild_id):
+        # Forgets a guild this process no longer serves
+        self._ready.discard(guild_id)
+        for task_id in list(self._by_guild.get(guild_id, ())):
+            self.remove(task_id)
+
+    # Tasks
+
+    def get(self, task_id):
+        return self._tasks.get(task_id)
+
+    def all(self, guild_id=None):
+        if guild_id is None:
+            return list(self._tasks.values())
+        return [self._tasks[task_id] for task_id in self._by_guild.get(guild_id, ())]
+
+    def by_role(self, role_id):
+        return [self._tasks[task_id] for task_id in self._by_role.get(role_id, ())]
+
+    def put(self, task):
+        self._unindex(task.id)
+        self._tasks[task.id] = task
+        self._by_guild[task.guild_id].add(task.id)
+        if task.assigned_role:
+            self._by_role[task.assigned_role].add(task.id)
+        self._notify(task.id, task)
+
+    def patch(self, task_id, fields):
+        task = self._tasks.get(task_id)
+        if task is not None:
+            self.put(task.replace(**fields))
+
+    def remove(self, task_id):
+        self._unindex(task_id)
+        if self._tasks.pop(task_id, None) is not None:
+            self._notify(task_id, None)
+        for key in [key for key in self._receivers if key[0] == task_id]:
+            del self._receivers[key]
+
+    def _unindex(self, task_id):
+        old = self._tasks.get(task_id)
+        if old is None:
+            return
+        guild_tasks = self._by_guild[old.guild_id]
+        guild_tasks.discard(task_id)
+        if not guild_tasks:
+            del self._by_guild[old.guild_id]
+        if old.assigned_role:
+            role_tasks = self._by_role[old.assigned_role]
+            role_tasks.discard(task_id)
+            if not role_tasks:
+                del self._by_role[old.assigned_role]
+
+    # Receivers
+
+    def get_receiver(self, task_id, user_id):
+        key = (task_id, str(user_id))
+        receiver = self._receivers.get(key)
+        if receiver is None:
+            return None
+        self._receivers.move_to_end(key)
+        return receiver
+
+    def put_receiver(self, task_id, user_id, receiver):
+        key = (task_id, str(user_id))
+        self._receivers[key] = receiver
+        self._receivers.move_to_end(key)
+        while len(self._receivers) > self._max_receivers:
+            self._receivers.popitem(last=False)
+
+    def patch_receiver(self, task_id, user_id, fields):
+        receiver = self._receivers.get((task_id, str(user_id)))
+        if receiver is not None:
+            self.put_receiver(task_id, user_id, receiver.replace(**fields))
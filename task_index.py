@@ -0,0 +1,71 @@
+import heapq
+from collections import defaultdict
+
+
+# Autocomplete index over task names and IDs, per guild. Registered as a task cache
+# listener, so it follows every change incrementally and lookups never touch storage.
+# Queries of three or more characters are narrowed down through a trigram index; shorter
+# ones scan the guild's tasks, which is cheap at the sizes a guild has.
+class TaskIndex:
+    def __init__(self):
+        # task_id -> (task, searchable text)
+        self._entries = {}
+        self._by_guild = defaultdict(set)
+        # guild_id -> trigram -> task IDs
+        self._trigrams = defaultdict(lambda: defaultdict(set))
+
+    def __len__(self):
+        return len(self._entries)
+
+    @staticmethod
+    def _grams(text):
+        return {text[i:i + 3] for i in range(len(text) - 2)}
+
+    def update(self, task_id, task):
+        # Cache listener; task is None when the task was removed
+        old = self._entries.pop(task_id, None)
+        if old is not None:
+            old_task, old_text = old
+            self._by_guild[old_task.guild_id].discard(task_id)
+            grams = self._trigrams[old_task.guild_id]
+            for gram in self._grams(old_text):
+                grams[gram].discard(task_id)
+                if not grams[gram]:
+                    del grams[gram]
+
+        if task is None:
+            return
+        text = f"{task.task_name} {task.id}".lower()
+        self._entries[task_id] = (task, text)
+        self._by_guild[task.guild_id].add(task_id)
+        grams = self._trigrams[task.guild_id]
+        for gram in self._grams(text):
+            grams[gram].add(task_id)
+
+    def search(self, guild_id, query, visible=None, exclude=(), limit=25):
+        # Tasks whose name or ID contains the query, best matches first: name or ID
+        # prefix, then word prefix, then anywhere; ties by due date. visible(task)
+        # filters out tasks the user may not pick.
+        query = query.strip().lower()
+        if len(query) >= 3:
+            grams = self._trigrams.get(guild_id, {})
+            sets = sorted((grams.get(gram, set()) for gram in self._grams(query)), key=len)
+            candidates = set.intersection(*sets) if sets[0] else set()
+        else:
+            candidates = self._by_guild.get(guild_id, set())
+
+        ranked = []
+        for task_id in candidates:
+            if task_id in exclude:
+                continue
+            task, text = self._entries[task_id]
+            if query not in text or (visible is not None and not visible(task)):
+                continue
+            if text.startswith(query) or task_id.lower().startswith(query):
+                rank = 0
+            elif f" {query}" in text:
+                rank = 1
+            else:
+                rank = 2
+            ranked.append((rank, task.due_date, task_id))
+        return [self._entries[task_id][0] for _, _, task_id in heapq.nsmallest(limit, ranked)]
@@ -0,0 +1,399 @@
+import asyncio
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+import storage
+from instrumentation import record_storage_op
+from models import SCHEMA_VERSION, MemberStats, Receiver, Task
+from storage import ALREADY_SUBMITTED, SUBMITTED, TaskNotFound, submitted_on_time
+from task_cache import TaskCache
+
+
+log = logging.getLogger("cn_bot.storage")
+
+# Storage engines are synchronous (firebase_admin, sqlite3), so every read/write below is
+# pushed onto a bounded thread pool instead of running inside the event loop. A burst of
+# interactions queues on the pool rather than freezing heartbeats for the whole guild.
+STORAGE_WORKERS = int(os.getenv("STORAGE_WORKERS", os.getenv("FIRESTORE_WORKERS", "16")))
+_executor = ThreadPoolExecutor(max_workers=STORAGE_WORKERS, thread_name_prefix="storage")
+
+backend = None
+cache = TaskCache(max_receivers=int(os.getenv("TASK_CACHE_RECEIVERS", "5000")))
+# Guild the bot ran in before tasks were scoped per guild; its old, unscoped tasks are
+# moved into its collection the first time it is watched
+LEGACY_GUILD_ID = os.getenv("LEGACY_GUILD_ID")
+# guild_id -> (task watch, settings watch), None while being set up
+_watches = {}
+_configs = {}
+_background = set()
+
+
+class _LazyBackend:
+    # Creates the storage engine on first use. Creating it loads credentials and opens
+    # clients, so it happens on a storage worker rather than at import or in the loop.
+    def __init__(self, factory):
+        self._factory = factory
+        self._backend = None
+        self._lock = threading.Lock()
+
+    def connect(self):
+        with self._lock:
+            if self._backend is None:
+                self._backend = self._factory()
+        return self._backend
+
+    def __getattr__(self, name):
+        def call(*args):
+            return getattr(self.connect(), name)(*args)
+        call.__name__ = name
+        return call
+
+
+def init(task_backend=None):
+    # Defaults to the engine selected by STORAGE_BACKEND, connected lazily
+    global backend
+    backend = task_backend or _LazyBackend(storage.create_backend)
+
+
+async def connect():
+    # Connects the storage engine ahead of its first use. A failure is logged and the
+    # connection retried by the first storage call.
+    if isinstance(backend, _LazyBackend):
+        try:
+            await _run(backend.connect)
+        except Exception:
+            log.exception("Could not connect to storage; retrying on first use")
+
+
+async def _run(func, *args):
+    loop = asyncio.get_running_loop()
+    started = time.perf_counter()
+    try:
+        return await loop.run_in_executor(_executor, partial(func, *args))
+    finally:
+        # Includes time spent queued for a worker, which is what the caller waits on
+        record_storage_op(func.__name__, time.perf_counter() - started)
+
+
+def _spawn(coro):
+    task = asyncio.create_task(coro)
+    _background.add(task)
+    task.add_done_callback(_background.discard)
+
+
+# Cache maintenance. Each process only watches the guilds its shards serve; the watches
+# deliver every change to those guilds' tasks and settings, including writes made by
+# other processes, so all processes' caches converge on the stored state.
+
+def _apply_changes(guild_id, changes, first_snapshot):
+    if guild_id not in _watches:
+        return
+    for kind, task_id, data in changes:
+        if kind == 'REMOVED':
+            cache.remove(task_id)
+        else:
+            data["id"] = task_id
+            data["guild_id"] = guild_id
+            cache.put(Task.from_dict(data))
+    cache.mark_ready(guild_id)
+    first_snapshot.set()
+
+
+def _apply_config(guild_id, config, first_snapshot):
+    if guild_id not in _watches:
+        return
+    _configs[guild_id] = config
+    first_snapshot.set()
+
+
+async def watch_guild(guild_id):
+    # Loads a guild's tasks and settings into memory and keeps them current
+    guild_id = str(guild_id)
+    if guild_id in _watches:
+        return
+    _watches[guild_id] = None
+    loop = asyncio.get_running_loop()
+    first_tasks, first_config = asyncio.Event(), asyncio.Event()
+
+    def on_changes(changes):
+        # May run on a listener thread; hand the data over to the event loop
+        loop.call_soon_threadsafe(_apply_changes, guild_id, changes, first_tasks)
+
+    def on_config(config):
+        loop.call_soon_threadsafe(_apply_config, guild_id, config, first_config)
+
+    watches = []
+    try:
+        if guild_id == LEGACY_GUILD_ID:
+            await _run(backend.claim_unscoped_tasks, guild_id)
+        watches.append(await _run(backend.watch_tasks, guild_id, on_changes))
+        watches.append(await _run(backend.watch_guild_config, guild_id, on_config))
+    except Exception:
+        # Drop the placeholder so a later call (the next on_ready) can try again
+        for watch in watches:
+            watch.unsubscribe()
+        _watches.pop(guild_id, None)
+        raise
+    if guild_id not in _watches:
+        # Left the guild while the watches were being set up
+        for watch in watches:
+            watch.unsubscribe()
+        return
+    _watches[guild_id] = watches
+    await first_tasks.wait()
+    await first_config.wait()
+    _spawn(_upgrade_tasks(guild_id))
+
+
+async def unwatch_guild(guild_id):
+    guild_id = str(guild_id)
+    for watch in _watches.pop(guild_id, None) or ():
+        watch.unsubscribe()
+    _configs.pop(guild_id, None)
+    cache.drop_guild(guild_id)
+
+
+async def warm_cache(guild_ids):
+    # The watches' first snapshots carry every task of each guild and warm the cache. A
+    # guild whose watch fails is logged and skipped: its reads go to storage until the
+    # next on_ready tries again, and the other guilds and the scheduler still start.
+    results = await asyncio.gather(*(watch_guild(guild_id) for guild_id in guild_ids), return_exceptions=True)
+    for guild_id, result in zip(guild_ids, results):
+        if isinstance(result, Exception):
+            log.error("Could not watch guild %s", guild_id, exc_info=result)
+
+
+async def _upgrade_tasks(guild_id):
+    # Persists the in-memory schema upgrade of older tasks and recounts receivers of
+    # tasks created before the counters existed. Runs one task at a time so it never
+    # competes with command traffic for the whole worker pool.
+    for task in cache.all(guild_id):
+        if task.schema_version < SCHEMA_VERSION:
+            await update_task(guild_id, task.id, {"due_date": task.due_date, "schema_version": SCHEMA_VERSION})
+        if not task.counters_synced:
+            await receiver_counts(guild_id, task.id)
+
+
+def _task(data):
+    return Task.from_dict(data) if data is not None else None
+
+
+# Async API used by the command handlers. Every call is scoped to one guild (guild IDs
+# may be passed as ints); tasks and receivers come back as models.Task /
+# models.Receiver; writes take plain field dicts.
+
+def guild_config(guild_id):
+    # The guild's settings from memory; {} for a guild this process doesn't watch
+    return _configs.get(str(guild_id), {})
+
+
+async def fetch_guild_config(guild_id):
+    # The guild's settings from memory once its watch has delivered them, from storage
+    # before that (during startup, or when the watch failed to start). Access checks use
+    # this, so they never fall back to the default role names for a configured guild.
+    guild_id = str(guild_id)
+    if guild_id in _configs:
+        return _configs[guild_id]
+    return await _run(backend.get_guild_config, guild_id)
+
+
+async def update_guild_config(guild_id, fields):
+    guild_id = str(guild_id)
+    await _run(backend.update_guild_config, guild_id, fields)
+    if guild_id in _configs:
+        config = {**_configs[guild_id], **fields}
+        _configs[guild_id] = {key: value for key, value in config.items() if value is not None}
+
+
+async def get_task(guild_id, task_id):
+    guild_id = str(guild_id)
+    task = cache.get(task_id)
+    if task is not None:
+        return task if task.guild_id == guild_id else None
+    # Not cached (cold cache, or created elsewhere and not delivered yet)
+    task = _task(await _run(backend.get_task, guild_id, task_id))
+    if task is not None and cache.is_ready(guild_id):
+        cache.put(task)
+    return task
+
+
+async def get_tasks(guild_id, task_ids):
+    # Cached tasks are answered from memory, the rest in a single batched read
+    guild_id = str(guild_id)
+    tasks = {}
+    for task_id in task_ids:
+        task = cache.get(task_id)
+        if task is not None and task.guild_id == guild_id:
+            tasks[task_id] = task
+    missing = [task_id for task_id in task_ids if task_id not in tasks and task_id not in cache]
+    if missing:
+        for data in await _run(backend.get_tasks, guild_id, missing):
+            task = tasks[data["id"]] = Task.from_dict(data)
+            if cache.is_ready(guild_id):
+                cache.put(task)
+    return [tasks[task_id] for task_id in task_ids if task_id in tasks]
+
+
+async def create_task(guild_id, task):
+    guild_id = str(guild_id)
+    task = {
+        **task,
+        "guild_id": guild_id,
+        "received_count": 0,
+        "completed_count": 0,
+        "counters_synced": True,
+        "schema_version": SCHEMA_VERSION,
+        "updated_at": time.time(),
+    }
+    task_id = await _run(backend.create_task, guild_id, task)
+    cache.put(Task.from_dict({**task, "id": task_id}))
+    return task_id
+
+
+async def update_task(guild_id, task_id, fields):
+    await update_tasks(guild_id, [task_id], fields)
+
+
+async def update_tasks(guild_id, task_ids, fields):
+    guild_id = str(guild_id)
+    fields = {**fields, "updated_at": time.time()}
+    if len(task_ids) == 1:
+        await _run(backend.update_task, guild_id, task_ids[0], fields)
+    else:
+        await _run(backend.update_tasks, guild_id, task_ids, fields)
+    for task_id in task_ids:
+        cache.patch(task_id, fields)
+
+
+async def delete_task(guild_id, task_id):
+    await _run(backend.delete_task, str(guild_id), task_id)
+    cache.remove(task_id)
+
+
+async def list_tasks_page(guild_id, role_id=None, status=None, limit=10, start_after=None):
+    # Returns up to `limit` tasks ordered by (due_date, id), starting after the
+    # (due_date, id) cursor of the previous page.
+    guild_id = str(guild_id)
+    if not cache.is_ready(guild_id):
+        rows = await _run(backend.list_tasks_page, guild_id, role_id, status, limit, start_after)
+        return [Task.from_dict(data) for data in rows]
+    tasks = cache.all(guild_id) if role_id is None else cache.by_role(role_id)
+    tasks = sorted(
+        (task for task in tasks if status is None or task.status == status),
+        key=lambda task: (task.due_date, task.id)
+    )
+    if start_after is not None:
+        tasks = [task for task in tasks if (task.due_date, task.id) > tuple(start_after)]
+    return tasks[:limit]
+
+
+def _patch_counters(task_id, counters):
+    # Counters as stored right after the write, so applying them twice (once here, once
+    # from the watch) can't overcount
+    if counters:
+        cache.patch(task_id, {**counters, "counters_synced": True})
+
+
+async def receive_task(guild_id, task_id, user_id, data):
+    # Returns False if the user had already received the task; raises TaskNotFound if the
+    # task was deleted meanwhile
+    if cache.get_receiver(task_id, user_id) is not None:
+        return False
+    counters = await _run(backend.create_receiver, str(guild_id), task_id, user_id, data)
+    if counters is None:
+        return False
+    cache.put_receiver(task_id, user_id, Receiver.from_dict({**data, "id": str(user_id), "task_id": task_id}))
+    _patch_counters(task_id, counters)
+    return True
+
+
+async def receive_tasks(guild_id, user_id, data_by_task):
+    # Bulk receive; returns the IDs of the tasks that were newly received and of those
+    # that were deleted meanwhile
+    created, missing = await _run(backend.create_receivers, str(guild_id), user_id, data_by_task)
+    for task_id, counters in created.items():
+        receiver = Receiver.from_dict({**data_by_task[task_id], "id": str(user_id), "task_id": task_id})
+        cache.put_receiver(task_id, user_id, receiver)
+        _patch_counters(task_id, counters)
+    return list(created), missing
+
+
+async def submit_task(guild_id, task_id, user_id, fields, task=None):
+    # Returns SUBMITTED, ALREADY_SUBMITTED or NOT_RECEIVED; raises TaskNotFound if the
+    # task was deleted meanwhile
+    receiver = cache.get_receiver(task_id, user_id)
+    if receiver is not None and receiver.status == 'completed':
+        return ALREADY_SUBMITTED
+    task = task or await get_task(guild_id, task_id)
+    on_time = submitted_on_time(fields.get("submitted_at"), task.due_date) if task else None
+    result, counters = await _run(backend.submit_receiver, str(guild_id), task_id, user_id, fields, on_time)
+    if result == SUBMITTED:
+        cache.patch_receiver(task_id, user_id, fields)
+        _patch_counters(task_id, counters)
+    return result
+
+
+async def receiver_counts(guild_id, task_id, task=None):
+    # {"received_count": ..., "completed_count": ...} straight off the task document,
+    # recounting once for tasks that predate the counters
+    task = task or await get_task(guild_id, task_id)
+    if task and task.counters_synced:
+        return {"received_count": task.received_count, "completed_count": task.completed_count}
+    counters = await _run(backend.sync_counters, str(guild_id), task_id)
+    cache.patch(task_id, {**counters, "counters_synced": True})
+    return counters
+
+
+async def list_receivers(guild_id, task_id, limit=None, start_after=None):
+    # Ordered by (received_at, id); pass the last receiver's (received_at, id) as
+    # start_after to fetch the next page
+    rows = await _run(backend.list_receivers, str(guild_id), task_id, limit, start_after)
+    return [Receiver.from_dict({**data, "task_id": task_id}) for data in rows]
+
+
+def export_receivers(guild_id, task_id, status, consume):
+    # Runs on a storage worker: the whole backend iteration happens off the event loop
+    receivers = (
+        Receiver.from_dict(data) for data in backend.iter_receivers(guild_id, task_id, status)
+    )
+    return consume(receivers)
+
+
+async def stream_receivers(guild_id, consume, task_id=None, status=None):
+    # Hands consume() a lazy iterator over the guild's receivers (or one task's) and
+    # returns its result. consume runs on a storage worker thread, so it may block but
+    # must not touch the event loop.
+    return await _run(export_receivers, str(guild_id), task_id, status, consume)
+
+
+async def list_submissions(guild_id, limit=None):
+    # Completed receivers of every task in the guild (at most limit of them), with
+    # task_id and task_name filled in
+    rows = await _run(backend.list_submissions, str(guild_id), limit)
+    return [Receiver.from_dict(data) for data in rows]
+
+
+async def count_submissions(guild_id):
+    # Summed from the cached tasks' completed counters when they are all in sync,
+    # otherwise counted by the backend
+    guild_id = str(guild_id)
+    if cache.is_ready(guild_id):
+        tasks = cache.all(guild_id)
+        if all(task.counters_synced for task in tasks):
+            return sum(task.completed_count for task in tasks)
+    return await _run(backend.count_submissions, guild_id)
+
+
+async def member_stats(guild_id, user_id):
+    # The member's received/completed/on-time/late counts; None before their first receive
+    data = await _run(backend.get_member_stats, str(guild_id), user_id)
+    return MemberStats.from_dict(data) if data is not None else None
+
+
+async def leaderboard(guild_id, limit=10):
+    # The members with the most completed tasks (then the most on time), best first
+    return [MemberStats.from_dict(data) for data in await _run(backend.top_members, str(guild_id), limit)]
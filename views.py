@@ -0,0 +1,185 @@
+from collections import OrderedDict
+
+import discord
+
+import responses
+import task_store
+
+
+PAGE_SIZE = 10
+# Embed field values are capped at 1024 characters and a whole embed at 6000, so long
+# descriptions are trimmed to keep a full page inside Discord's limits.
+DESCRIPTION_LIMIT = 300
+
+
+# Rendered task fields, least recently used first. Keyed by task ID and update time (plus
+# the role name, which can change without the task being touched), so an unchanged task
+# is formatted once no matter how often it is listed.
+RENDER_CACHE_SIZE = 1024
+_rendered = OrderedDict()
+
+
+def task_field(guild, task):
+    assigned_role = guild.get_role(int(task.assigned_role)) if task.assigned_role else None
+    assigned_role_name = assigned_role.name if assigned_role else "None"
+
+    key = (task.id, task.updated_at, assigned_role_name)
+    field = _rendered.get(key)
+    if field is not None:
+        _rendered.move_to_end(key)
+        return field
+
+    description = task.description or ""
+    if len(description) > DESCRIPTION_LIMIT:
+        description = description[:DESCRIPTION_LIMIT - 1] + "…"
+
+    embed_value = (
+        f"**Name:** {task.task_name}\n"
+        f"**Description:** {description}\n"
+        f"**Due Date:** <t:{task.due_date}:F>\n"  # Display as full date/time
+        f"**Assigned Role:** {assigned_role_name}\n"
+        f"**Status:** {task.status}\n"
+    )
+
+    if task.link:
+        embed_value += f"**Link:** [Click Here]({task.link})\n"
+
+    field = _rendered[key] = (f"Task ID: {task.id}", embed_value)
+    if len(_rendered) > RENDER_CACHE_SIZE:
+        _rendered.popitem(last=False)
+    return field
+
+
+# Base for cursor-paginated embeds. Only one page is held at a time; the view keeps the
+# cursor each visited page started after so it can walk back.
+class CursorPageView(discord.ui.View):
+    page_size = PAGE_SIZE
+    command_name = None
+
+    def __init__(self, user_id):
+        super().__init__(timeout=180)
+        self.user_id = user_id
+        self.cursors = [None]
+        self.items = []
+        self.has_next = False
+        self.message = None
+
+    async def fetch(self, limit, start_after):
+        raise NotImplementedError
+
+    def cursor(self, item):
+        raise NotImplementedError
+
+    async def load(self):
+        # Fetch one extra item to find out whether a next page exists
+        items = await self.fetch(self.page_size + 1, self.cursors[-1])
+        self.has_next = len(items) > self.page_size
+        self.items = items[:self.page_size]
+        self.previous_page.disabled = len(self.cursors) == 1
+        self.next_page.disabled = not self.has_next
+
+    @property
+    def paginated(self):
+        return self.has_next or len(self.cursors) > 1
+
+    @property
+    def page(self):
+        return len(self.cursors)
+
+    async def interaction_check(self, interaction: discord.Interaction):
+        # Page fetches may hit storage on a cold cache; let the response layer defer
+        responses.track(interaction)
+        if interaction.user.id != self.user_id:
+            await interaction.response.send_message(f"Only the person who ran /{self.command_name} can change pages.", ephemeral=True)
+            return False
+        return True
+
+    @discord.ui.button(label="Previous", style=discord.ButtonStyle.secondary)
+    async def previous_page(self, interaction: discord.Interaction, button: discord.ui.Button):
+        self.cursors.pop()
+        await self.load()
+        await interaction.response.edit_message(embed=self.embed(interaction.guild), view=self)
+
+    @discord.ui.button(label="Next", style=discord.ButtonStyle.primary)
+    async def next_page(self, interaction: discord.Interaction, button: discord.ui.Button):
+        self.cursors.append(self.cursor(self.items[-1]))
+        await self.load()
+        await interaction.response.edit_message(embed=self.embed(interaction.guild), view=self)
+
+    async def on_timeout(self):
+        for item in self.children:
+            item.disabled = True
+        if self.message:
+            try:
+                await self.message.edit(view=self)
+            except discord.HTTPException:
+                pass
+
+
+# /list-tasks result, paged by (due_date, id)
+class TaskListView(CursorPageView):
+    command_name = "list-tasks"
+
+    def __init__(self, user_id, guild_id, role=None, status=None):
+        super().__init__(user_id)
+        self.guild_id = guild_id
+        self.role = role
+        self.role_id = str(role.id) if role else None
+        self.status = status
+
+    async def fetch(self, limit, start_after):
+        return await task_store.list_tasks_page(self.guild_id, self.role_id, self.status, limit, start_after)
+
+    def cursor(self, task):
+        return task.due_date, task.id
+
+    def embed(self, guild):
+        embed = discord.Embed(title="Tasks List", color=discord.Color.orange(), description="Here are your tasks:")
+
+        for task in self.items:
+            name, value = task_field(guild, task)
+            embed.add_field(name=name, value=value, inline=False)
+
+        if not self.items:
+            embed.description = "No tasks found." if self.role is None else f"No tasks found for role: {self.role.name}"
+        if self.paginated:
+            embed.set_footer(text=f"Page {self.page}")
+        return embed
+
+
+# /receive-list result: the task's counters plus one page of receiver names, paged by
+# (received_at, id)
+class ReceiverListView(CursorPageView):
+    command_name = "receive-list"
+    # One display name (32 characters at most) per line has to fit into a single
+    # 1024 character field
+    page_size = 25
+
+    def __init__(self, user_id, task, counters):
+        super().__init__(user_id)
+        self.task = task
+        self.counters = counters
+
+    async def fetch(self, limit, start_after):
+        return await task_store.list_receivers(self.task.guild_id, self.task.id, limit, start_after)
+
+    def cursor(self, receiver):
+        return receiver.received_at, receiver.id
+
+    def embed(self, guild):
+        embed = discord.Embed(
+            title=f"Task: {self.task.task_name}",
+            description=f"Task ID: {self.task.id}",
+            color=discord.Color.orange()
+        )
+
+        received = self.counters['received_count']
+        completed = self.counters['completed_count']
+        embed.add_field(name="Submissions Count", value=f"{received} received, {completed} submitted", inline=False)
+
+        names = [receiver.user_name or 'Unknown User' for receiver in self.items]
+        embed.add_field(name="Students Who Received", value="\n".join(names) if names else "No submissions yet.", inline=False)
+
+        if self.paginated:
+            embed.set_footer(text=f"Page {self.page}")
+        return embed